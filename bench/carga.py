@@ -0,0 +1,287 @@
+"""Teste de carga: muitas sessões de jogo simultâneas contra o servidor falso
+
+Cada sessão roda o main.py pelo AppTest do Streamlit e joga uma partida inteira: abre a
+tela inicial, começa o caso, explora um local, interroga um suspeito, pede o resumo e acusa. No fim, mostra a
+vazão, os percentis p50/p99 de cada ação, a memória de pico por sessão e as chamadas ao
+LLM por partida, por operação. O pool de casos fica desligado (POOL_CASOS_PROFUNDIDADE=0,
+a menos que o ambiente diga outra coisa) para que cada partida gere o próprio caso; as
+respostas antecipadas aparecem numa linha à parte, porque dependem do tempo de cada sessão.
+
+    python bench/carga.py --sessoes 50 --concorrencia 10 --latencia 0.3 --erros 0.02
+    python bench/carga.py --sessoes 200 --json resultado.json --base anterior.json
+"""
+import argparse
+import json
+import os
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, RAIZ)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import servidor_falso
+
+# Operações de métricas que são chamadas ao LLM; as antecipações ficam fora da conta da partida
+OPERACOES_LLM = ("gerar_caso", "reparar_secao", "interrogatorio", "gerar_resumo", "avaliar_teoria")
+OPERACAO_ANTECIPACAO = "antecipacao"
+
+ACOES = ("tela_inicial", "iniciar", "explorar", "procurar_pista", "escolher_suspeito", "interrogar", "resumo", "acusar")
+
+
+def _percentil(valores, q):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(q / 100 * (len(ordenados) - 1))))]
+
+
+def _tamanho(objeto, vistos):
+    """Bytes de 'objeto' e do que ele referencia (cada objeto conta uma vez)"""
+    if id(objeto) in vistos or isinstance(objeto, (type, type(sys))) or callable(objeto):
+        return 0
+    vistos.add(id(objeto))
+    tamanho = sys.getsizeof(objeto)
+    if isinstance(objeto, dict):
+        tamanho += sum(_tamanho(k, vistos) + _tamanho(v, vistos) for k, v in objeto.items())
+    elif isinstance(objeto, (list, tuple, set, frozenset, deque)):
+        tamanho += sum(_tamanho(item, vistos) for item in objeto)
+    elif hasattr(objeto, "__dict__"):
+        tamanho += _tamanho(vars(objeto), vistos)
+    elif hasattr(objeto, "__slots__"):
+        tamanho += sum(_tamanho(getattr(objeto, s, None), vistos) for s in objeto.__slots__)
+    return tamanho
+
+
+def jogar(AppTest, timeout):
+    """Uma partida completa; devolve ({ação: segundos}, bytes do session_state no fim)"""
+    tempos = {}
+
+    def medir(acao, preparar):
+        try:
+            executar = preparar()
+        except KeyError as e:
+            raise RuntimeError(f"{acao}: elemento {e} não está na tela") from None
+        inicio = time.perf_counter()
+        resultado = executar()
+        tempos[acao] = time.perf_counter() - inicio
+        if resultado.exception:
+            raise RuntimeError(f"{acao}: {resultado.exception[0].value}")
+        return resultado
+
+    def comecar():
+        return next(b for b in at.button if b.label.startswith("▶️")).click().run
+
+    at = AppTest.from_file(os.path.join(RAIZ, "main.py"), default_timeout=timeout)
+    medir("tela_inicial", lambda: at.run)
+    try:
+        medir("iniciar", comecar)
+    except StopIteration:
+        raise RuntimeError("tela_inicial: botão de começar não está na tela") from None
+    caso = at.session_state.caso
+    if caso is None:
+        raise RuntimeError("iniciar: o caso não foi gerado")
+    local = caso.locais[0].nome
+    suspeito = caso.personagens[-1].nome
+
+    medir("explorar", lambda: at.button(key=f"loc_{local}").click().run)
+    medir("procurar_pista", lambda: at.button(key="procurar_pistas").click().run)
+    medir("escolher_suspeito", lambda: at.button(key=f"char_{suspeito}").click().run)
+    medir("interrogar", lambda: at.text_input(key="pergunta_input").input("Onde você estava às 22h?").run)
+    medir("resumo", lambda: at.button(key="gerar_resumo").click().run)
+    def acusar():
+        at.text_input(key="acusacao_input").input(caso.culpado.nome)
+        return at.button(key="fazer_acusacao").click().run
+
+    medir("acusar", acusar)
+    # Inclui o caso, que a sessão segura mesmo quando ele veio do pool ou da biblioteca
+    return tempos, _tamanho(at.session_state.filtered_state, set())
+
+
+def _runtime_compartilhado():
+    """O AppTest troca o Runtime global a cada execução, o que quebra execuções simultâneas no
+    mesmo processo. Aqui todas passam a ver um único runtime falso, como as sessões de um
+    servidor de verdade veem o mesmo runtime."""
+    from unittest.mock import MagicMock
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+    from streamlit.runtime.media_file_manager import MediaFileManager
+    from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+
+    runtime = MagicMock(spec=Runtime)
+    runtime.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    runtime.cache_storage_manager = MemoryCacheStorageManager()
+    Runtime.instance = classmethod(lambda cls: runtime)
+    Runtime.exists = classmethod(lambda cls: True)
+
+
+def executar(args):
+    servidor = servidor_falso.iniciar(
+        latencia=args.latencia, jitter=args.jitter, erros=args.erros, intervalo_trecho=args.intervalo_trecho
+    )
+    # Tudo o que o app lê do ambiente precisa estar definido antes do primeiro import dele
+    os.environ.update({
+        "OPENROUTER_BASE_URL": servidor.url,
+        "OPENROUTER_API_KEY": "bench",
+        "LLM_REQ_POR_MINUTO": os.environ.get("LLM_REQ_POR_MINUTO", "1000000"),
+        "LLM_RAJADA": os.environ.get("LLM_RAJADA", "100000"),
+        "LLM_CONCORRENCIA": os.environ.get("LLM_CONCORRENCIA", str(max(4, args.concorrencia * 2))),
+        # Reabastecer o pool gera casos que nenhuma partida usa e confunde a contagem de chamadas
+        "POOL_CASOS_PROFUNDIDADE": os.environ.get("POOL_CASOS_PROFUNDIDADE", "0"),
+        "DETETIVES_DB": os.environ.get("DETETIVES_DB", os.path.join(tempfile.mkdtemp(prefix="detetives-bench-"), "bench.db")),
+    })
+    os.chdir(RAIZ)
+    from streamlit.testing.v1 import AppTest
+    import metrics
+    # Os módulos do app entram antes da medida de base, para que ela não some os imports
+    import interface  # noqa: F401
+    _runtime_compartilhado()
+
+    rss_base = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if args.memoria:
+        tracemalloc.start()
+    tempos = {acao: [] for acao in ACOES}
+    estados = []
+    falhas = []
+    lock = threading.Lock()
+
+    def sessao(_):
+        try:
+            resultado, estado = jogar(AppTest, args.timeout)
+        except Exception as e:
+            with lock:
+                falhas.append(str(e))
+            return
+        with lock:
+            estados.append(estado)
+            for acao, segundos in resultado.items():
+                tempos[acao].append(segundos)
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concorrencia) as executor:
+        list(executor.map(sessao, range(args.sessoes)))
+    duracao = time.perf_counter() - inicio
+
+    partidas = len(tempos["acusar"])
+    simultaneas = min(args.concorrencia, args.sessoes)
+    rss_pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    chamadas = servidor.estatisticas()
+    operacoes = {nome: info["chamadas"] for nome, info in metrics.resumo().items()}
+    por_operacao = {nome: operacoes.get(nome, 0) for nome in OPERACOES_LLM}
+    relatorio = {
+        "sessoes": args.sessoes,
+        "concorrencia": args.concorrencia,
+        "partidas_concluidas": partidas,
+        "falhas": len(falhas),
+        "duracao_s": round(duracao, 3),
+        "partidas_por_s": round(partidas / duracao, 3) if duracao else None,
+        "acoes_por_s": round(sum(len(v) for v in tempos.values()) / duracao, 3) if duracao else None,
+        "acoes": {
+            acao: {"n": len(v), "p50": _percentil(v, 50), "p99": _percentil(v, 99)}
+            for acao, v in tempos.items()
+        },
+        # Quanto o pico de RSS subiu depois dos imports, dividido pelas sessões que rodavam juntas
+        "memoria_pico_por_sessao_kb": round((rss_pico - rss_base) / simultaneas),
+        "memoria_rss_pico_processo_kb": rss_pico,
+        # Tamanho do session_state de cada sessão ao fim da partida
+        "session_state_kb": {
+            "p50": round(_percentil(estados, 50) / 1024, 1), "max": round(max(estados) / 1024, 1)
+        } if estados else None,
+        # Requisições HTTP que o servidor falso recebeu, com novas tentativas e hedges
+        "chamadas_llm": chamadas,
+        # Chamadas que o app registrou, por operação; só as das partidas entram no total
+        "chamadas_llm_por_operacao": {
+            nome: round(n / partidas, 2) for nome, n in por_operacao.items()
+        } if partidas else None,
+        "chamadas_llm_por_partida": round(sum(por_operacao.values()) / partidas, 2) if partidas else None,
+        "antecipacoes_por_partida": round(operacoes.get(OPERACAO_ANTECIPACAO, 0) / partidas, 2) if partidas else None,
+    }
+    if args.memoria:
+        relatorio["memoria_python_pico_por_sessao_kb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / simultaneas)
+        tracemalloc.stop()
+    if falhas:
+        relatorio["exemplos_de_falha"] = falhas[:5]
+    return relatorio
+
+
+def imprimir(relatorio):
+    print(f"\nPartidas: {relatorio['partidas_concluidas']}/{relatorio['sessoes']} "
+          f"({relatorio['falhas']} falhas) em {relatorio['duracao_s']}s, {relatorio['concorrencia']} simultâneas")
+    print(f"Vazão: {relatorio['partidas_por_s']} partidas/s · {relatorio['acoes_por_s']} ações/s")
+    print(f"\n{'ação':<20}{'n':>6}{'p50 (s)':>12}{'p99 (s)':>12}")
+    for acao, info in relatorio["acoes"].items():
+        p50 = f"{info['p50']:.3f}" if info["p50"] is not None else "-"
+        p99 = f"{info['p99']:.3f}" if info["p99"] is not None else "-"
+        print(f"{acao:<20}{info['n']:>6}{p50:>12}{p99:>12}")
+    print(f"\nMemória de pico por sessão: ~{relatorio['memoria_pico_por_sessao_kb']} KB "
+          f"(aumento do RSS / {min(relatorio['concorrencia'], relatorio['sessoes'])} simultâneas; "
+          f"processo: {relatorio['memoria_rss_pico_processo_kb']} KB)")
+    if relatorio["session_state_kb"]:
+        print(f"session_state por sessão: p50 {relatorio['session_state_kb']['p50']} KB · "
+              f"máx. {relatorio['session_state_kb']['max']} KB")
+    if "memoria_python_pico_por_sessao_kb" in relatorio:
+        print(f"Memória Python de pico por sessão: ~{relatorio['memoria_python_pico_por_sessao_kb']} KB (tracemalloc)")
+    print(f"Chamadas ao LLM por partida: {relatorio['chamadas_llm_por_partida']} {relatorio['chamadas_llm_por_operacao']}")
+    print(f"Antecipações por partida: {relatorio['antecipacoes_por_partida']}")
+    print(f"Requisições ao servidor falso: {relatorio['chamadas_llm']['total']} {relatorio['chamadas_llm']['chamadas']}")
+    for falha in relatorio.get("exemplos_de_falha", []):
+        print(f"  falha: {falha}")
+
+
+def regressoes(relatorio, base, tolerancia):
+    """Ações cujo p99 piorou mais que 'tolerancia' (fração) em relação à execução de referência"""
+    piores = []
+    for acao, info in relatorio["acoes"].items():
+        anterior = base.get("acoes", {}).get(acao, {}).get("p99")
+        if anterior and info["p99"] is not None and info["p99"] > anterior * (1 + tolerancia):
+            piores.append(f"{acao}: p99 {anterior:.3f}s → {info['p99']:.3f}s")
+    # Por operação: cada partida faz sempre as mesmas, então a contagem é estável entre execuções
+    anteriores = base.get("chamadas_llm_por_operacao") or {}
+    for operacao, atual in (relatorio["chamadas_llm_por_operacao"] or {}).items():
+        anterior = anteriores.get(operacao)
+        if anterior and atual > anterior * (1 + tolerancia):
+            piores.append(f"chamadas ao LLM por partida ({operacao}): {anterior} → {atual}")
+    return piores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sessoes", type=int, default=50)
+    parser.add_argument("--concorrencia", type=int, default=10, help="sessões jogando ao mesmo tempo")
+    parser.add_argument("--latencia", type=float, default=0.3, help="segundos até o primeiro trecho do LLM")
+    parser.add_argument("--jitter", type=float, default=0.1)
+    parser.add_argument("--erros", type=float, default=0.0, help="fração de respostas 429/503 do LLM")
+    parser.add_argument("--intervalo-trecho", type=float, default=0.01, help="segundos entre trechos do stream")
+    parser.add_argument("--timeout", type=float, default=120, help="limite de cada execução do script (s)")
+    parser.add_argument("--memoria", action="store_true", help="mede também a memória Python (tracemalloc; mais lento)")
+    parser.add_argument("--json", help="grava o relatório neste arquivo")
+    parser.add_argument("--base", help="relatório anterior; sai com erro se o p99 de alguma ação piorar")
+    parser.add_argument("--tolerancia", type=float, default=0.2, help="piora aceita em relação à --base (fração)")
+    args = parser.parse_args()
+
+    relatorio = executar(args)
+    imprimir(relatorio)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+    piores = []
+    if args.base:
+        with open(args.base, encoding="utf-8") as f:
+            piores = regressoes(relatorio, json.load(f), args.tolerancia)
+        if piores:
+            print("\nRegressões:")
+            for linha in piores:
+                print(f"  {linha}")
+    sys.stdout.flush()
+    # Threads de fundo do app (pool de casos, gravação de sessões) não seguram o processo
+    os._exit(1 if piores else 0)
+
+
+if __name__ == "__main__":
+    main()
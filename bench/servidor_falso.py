@@ -0,0 +1,213 @@
+"""Servidor local compatível com a API de chat da OpenRouter/OpenAI, para benchmarks sem rede
+
+Uso isolado:
+    python bench/servidor_falso.py --porta 8765 --latencia 0.4 --jitter 0.2 --erros 0.02
+e depois OPENROUTER_BASE_URL=http://127.0.0.1:8765/v1 streamlit run main.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+NOMES = ["Ana Souza", "Bruno Lima", "Carla Mendes", "Davi Rocha", "Elisa Prado", "Fábio Nunes"]
+LOCAIS = ["Biblioteca", "Jardim", "Cozinha", "Adega", "Escritório"]
+
+
+def caso_falso():
+    """Um caso válido, diferente a cada chamada (o id do caso vem do conteúdo)"""
+    semente = uuid.uuid4().hex[:6]
+    personagens = [
+        {"nome": nome, "descricao": f"Suspeito {i + 1}", "motivacao": "Dívidas antigas", "culpado": i == 0}
+        for i, nome in enumerate(random.sample(NOMES, 5))
+    ]
+    locais = [{"nome": nome, "descricao": f"Um cômodo da mansão ({nome.lower()})"} for nome in LOCAIS[:4]]
+    pistas = [
+        {"descricao": f"Pista {i + 1} do caso {semente}", "local": locais[i % len(locais)]["nome"], "verdadeira": i != 2}
+        for i in range(6)
+    ]
+    return {
+        "titulo": f"🕯️ O Mistério {semente}",
+        "introducao": "Numa noite de tempestade, o barão foi encontrado sem vida na biblioteca.",
+        "personagens": personagens,
+        "locais": locais,
+        "pistas": pistas,
+        "linha_tempo": ["20h: jantar", "22h: um grito", "23h: a polícia chega"],
+    }
+
+
+def _texto(mensagem):
+    conteudo = mensagem.get("content", "")
+    # Mensagens com cache_control chegam como lista de partes
+    return conteudo if isinstance(conteudo, str) else "".join(p.get("text", "") for p in conteudo)
+
+
+def resposta_para(mensagens):
+    """Texto devolvido conforme o tipo de pedido; o tipo também vai para as estatísticas"""
+    prompt = "\n".join(_texto(m) for m in mensagens)
+    if "Reescreva SOMENTE essa seção" in prompt:
+        secao = prompt.split("seção '", 1)[1].split("'", 1)[0]
+        return "secao", json.dumps({secao: caso_falso().get(secao)}, ensure_ascii=False)
+    if "formato JSON" in prompt or "Formato JSON" in prompt:
+        return "caso", json.dumps(caso_falso(), ensure_ascii=False)
+    if "Resuma o caso" in prompt:
+        return "resumo", "Resumo: as pistas apontam para um conflito por dinheiro; falta confirmar o álibi do jardineiro."
+    if "Você é" in prompt:
+        return "interrogatorio", "Eu estava na biblioteca, lendo. Não ouvi nada até o grito."
+    return "texto", "O detetive reúne todos na sala e revela o que aconteceu naquela noite."
+
+
+class ServidorFalso(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, endereco, latencia=0.3, jitter=0.1, erros=0.0, intervalo_trecho=0.01, tamanho_trecho=12):
+        super().__init__(endereco, ManipuladorFalso)
+        self.latencia = latencia
+        self.jitter = jitter
+        self.erros = erros
+        self.intervalo_trecho = intervalo_trecho
+        self.tamanho_trecho = tamanho_trecho
+        self._lock = threading.Lock()
+        self.chamadas = {}
+        self.falhas = 0
+        # Prefixos (mensagens de sistema) já vistos, como no cache de prompt de um provedor
+        self._prefixos = set()
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}/v1"
+
+    def contar(self, tipo):
+        with self._lock:
+            self.chamadas[tipo] = self.chamadas.get(tipo, 0) + 1
+
+    def tokens_em_cache(self, mensagens):
+        """Tokens do prefixo que um provedor com cache de prompt teria reaproveitado"""
+        if not mensagens or mensagens[0].get("role") != "system":
+            return 0
+        # Cache por blocos (parágrafos) acumulados: vale o maior começo já visto antes
+        prefixo = ""
+        em_cache = 0
+        with self._lock:
+            for bloco in _texto(mensagens[0]).split("\n\n"):
+                prefixo += bloco + "\n\n"
+                if prefixo in self._prefixos:
+                    em_cache = len(prefixo) // 4
+                self._prefixos.add(prefixo)
+        return em_cache
+
+    def estatisticas(self):
+        with self._lock:
+            return {"chamadas": dict(self.chamadas), "total": sum(self.chamadas.values()), "falhas": self.falhas}
+
+    def espera(self):
+        return max(0.0, self.latencia + random.uniform(-self.jitter, self.jitter))
+
+
+class ManipuladorFalso(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _json(self, status, dados, cabecalhos=()):
+        corpo = json.dumps(dados).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corpo)))
+        for nome, valor in cabecalhos:
+            self.send_header(nome, valor)
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def _trecho_http(self, dados):
+        self.wfile.write(f"{len(dados):X}\r\n".encode("ascii") + dados + b"\r\n")
+        self.wfile.flush()
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            self._json(200, self.server.estatisticas())
+        else:
+            self._json(404, {"error": {"message": "não encontrado"}})
+
+    def do_POST(self):
+        pedido = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        servidor = self.server
+        time.sleep(servidor.espera())
+        if random.random() < servidor.erros:
+            with servidor._lock:
+                servidor.falhas += 1
+            # Metade das falhas imita limite de taxa, metade imita o provedor fora do ar
+            if random.random() < 0.5:
+                self._json(429, {"error": {"message": "limite simulado"}}, [("Retry-After", "0")])
+            else:
+                self._json(503, {"error": {"message": "falha simulada"}})
+            return
+
+        tipo, texto = resposta_para(pedido.get("messages", []))
+        servidor.contar(tipo)
+        modelo = pedido.get("model", "falso")
+        mensagens = pedido.get("messages", [])
+        uso = {"prompt_tokens": sum(len(_texto(m)) for m in mensagens) // 4,
+               "completion_tokens": max(1, len(texto) // 4),
+               "prompt_tokens_details": {"cached_tokens": servidor.tokens_em_cache(mensagens)}}
+        uso["total_tokens"] = uso["prompt_tokens"] + uso["completion_tokens"]
+        identificador = f"falso-{uuid.uuid4().hex[:8]}"
+
+        if not pedido.get("stream"):
+            self._json(200, {
+                "id": identificador, "object": "chat.completion", "created": int(time.time()), "model": modelo,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": texto}, "finish_reason": "stop"}],
+                "usage": uso,
+            })
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        def evento(escolhas, extra=None):
+            dados = {"id": identificador, "object": "chat.completion.chunk", "created": int(time.time()),
+                     "model": modelo, "choices": escolhas, **(extra or {})}
+            self._trecho_http(f"data: {json.dumps(dados, ensure_ascii=False)}\n\n".encode("utf-8"))
+
+        try:
+            for i in range(0, len(texto), servidor.tamanho_trecho):
+                if i:
+                    time.sleep(servidor.intervalo_trecho)
+                evento([{"index": 0, "delta": {"content": texto[i:i + servidor.tamanho_trecho]}, "finish_reason": None}])
+            evento([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if (pedido.get("stream_options") or {}).get("include_usage"):
+                evento([], {"usage": uso})
+            self._trecho_http(b"data: [DONE]\n\n")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # O cliente fechou o stream no meio (ex.: hedge perdedor ou antecipação cancelada)
+            pass
+
+
+def iniciar(porta=0, **opcoes):
+    """Sobe o servidor numa thread; porta 0 escolhe uma livre"""
+    servidor = ServidorFalso(("127.0.0.1", porta), **opcoes)
+    threading.Thread(target=servidor.serve_forever, name="servidor-falso", daemon=True).start()
+    return servidor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--porta", type=int, default=8765)
+    parser.add_argument("--latencia", type=float, default=0.3, help="segundos até o primeiro trecho")
+    parser.add_argument("--jitter", type=float, default=0.1, help="variação da latência, para mais ou para menos")
+    parser.add_argument("--erros", type=float, default=0.0, help="fração de respostas 429/503")
+    parser.add_argument("--intervalo-trecho", type=float, default=0.01, help="segundos entre trechos do stream")
+    args = parser.parse_args()
+    servidor = ServidorFalso(("127.0.0.1", args.porta), args.latencia, args.jitter, args.erros, args.intervalo_trecho)
+    print(f"Servidor falso em {servidor.url}")
+    servidor.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+"""Perfil de partida a frio: quanto um processo novo leva até desenhar a tela inicial
+
+Cada repetição sobe um Python novo com -X importtime, importa o Streamlit e roda o main.py
+uma vez pelo AppTest (a tela inicial, sem nenhum caso). Mostra as medianas, se o openai, o
+httpx e o tenacity já estavam carregados na primeira tela e os imports mais caros.
+
+    python bench/tempo_inicial.py --repeticoes 5
+    git worktree add /tmp/anterior HEAD~1 && python bench/tempo_inicial.py --raiz /tmp/anterior
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+PESADOS = ("openai", "httpx", "tenacity", "pydantic", "dotenv")
+
+# Roda dentro do processo medido; imprime uma linha JSON no stdout
+SCRIPT = """
+import json, sys, time
+inicio = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+streamlit_s = time.perf_counter() - inicio
+at = AppTest.from_file("main.py", default_timeout=60)
+inicio = time.perf_counter()
+at.run()
+tela_s = time.perf_counter() - inicio
+print(json.dumps({
+    "streamlit_s": streamlit_s,
+    "primeira_tela_s": tela_s,
+    "carregados": [m for m in %r if m in sys.modules],
+    "botao": any(b.label.startswith("▶️") for b in at.button),
+    "excecao": str(at.exception[0].value) if at.exception else None,
+}))
+""" % (PESADOS,)
+
+
+def _imports(stderr):
+    """{módulo de topo: microssegundos acumulados} a partir da saída do -X importtime"""
+    tempos = {}
+    for linha in stderr.splitlines():
+        if not linha.startswith("import time:") or "|" not in linha:
+            continue
+        _, acumulado, nome = linha.split("|", 2)
+        if not acumulado.strip().isdigit() or nome.startswith("  "):
+            continue
+        nome = nome.strip()
+        tempos[nome] = tempos.get(nome, 0) + int(acumulado)
+    return tempos
+
+
+def medir_uma_vez(raiz):
+    ambiente = dict(os.environ)
+    ambiente.update({
+        # Endereço que recusa conexões: nada na tela inicial pode depender do LLM
+        "OPENROUTER_BASE_URL": "http://127.0.0.1:9/v1",
+        "OPENROUTER_API_KEY": "perfil",
+        # Sem reabastecer o pool, que gera casos em segundo plano e confundiria a medida
+        "POOL_CASOS_PROFUNDIDADE": "0",
+        "DETETIVES_DB": os.path.join(tempfile.mkdtemp(prefix="detetives-perfil-"), "perfil.db"),
+    })
+    processo = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", SCRIPT],
+        cwd=raiz, env=ambiente, capture_output=True, text=True, timeout=300,
+    )
+    if processo.returncode != 0:
+        raise RuntimeError(processo.stderr.strip().splitlines()[-1] if processo.stderr.strip() else "falhou")
+    resultado = json.loads(processo.stdout.strip().splitlines()[-1])
+    resultado["imports"] = _imports(processo.stderr)
+    return resultado
+
+
+def perfil(raiz, repeticoes):
+    # A primeira execução aquece o cache de bytecode e a do sistema de arquivos
+    medir_uma_vez(raiz)
+    medidas = [medir_uma_vez(raiz) for _ in range(repeticoes)]
+    ultima = medidas[-1]
+    modulos = set().union(*(m["imports"] for m in medidas))
+    imports = {
+        nome: statistics.median(m["imports"].get(nome, 0) for m in medidas) / 1e6
+        for nome in modulos
+    }
+    return {
+        "raiz": raiz,
+        "repeticoes": repeticoes,
+        "streamlit_s": statistics.median(m["streamlit_s"] for m in medidas),
+        "primeira_tela_s": statistics.median(m["primeira_tela_s"] for m in medidas),
+        "carregados_na_primeira_tela": ultima["carregados"],
+        "botao_comecar": ultima["botao"],
+        "excecao": ultima["excecao"],
+        "imports_mais_caros_s": dict(sorted(imports.items(), key=lambda item: -item[1])[:12]),
+    }
+
+
+def imprimir(relatorio):
+    print(f"\n{relatorio['raiz']} (medianas de {relatorio['repeticoes']} processos novos)")
+    print(f"  import do streamlit:     {relatorio['streamlit_s']:.3f}s")
+    print(f"  primeira tela (main.py): {relatorio['primeira_tela_s']:.3f}s")
+    carregados = ", ".join(relatorio["carregados_na_primeira_tela"]) or "nenhum"
+    print(f"  já carregados: {carregados} (de {', '.join(PESADOS)})")
+    if not relatorio["botao_comecar"]:
+        print("  atenção: o botão de começar não apareceu na tela")
+    if relatorio["excecao"]:
+        print(f"  exceção: {relatorio['excecao']}")
+    print(f"\n  {'import':<40}{'acumulado (s)':>15}")
+    for nome, segundos in relatorio["imports_mais_caros_s"].items():
+        print(f"  {nome:<40}{segundos:>15.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--raiz", default=RAIZ, help="checkout a medir (ex.: um git worktree da versão anterior)")
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--json", help="grava o relatório neste arquivo")
+    args = parser.parse_args()
+
+    relatorio = perfil(os.path.abspath(args.raiz), args.repeticoes)
+    imprimir(relatorio)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(relatorio, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,212 @@
+import re
+import threading
+import unicodedata
+from collections import Counter, OrderedDict
+
+# Palavras que não mudam o sentido de uma pergunta ao suspeito
+PALAVRAS_VAZIAS = frozenset("""
+a o as os um uma uns umas de da do das dos em na no nas nos num numa nuns numas
+por pela pelo pelas pelos para pra pro pras pros com e ou se entao ai afinal
+aquela aquele aquelas aqueles naquela naquele naquelas naqueles daquela daquele
+essa esse essas esses nessa nesse dessa desse isso nisso disso exatamente mesmo
+senhor senhora sr sra me diga diz conte fale sabe
+""".split())
+# Abreviações comuns de quem digita rápido
+ABREVIACOES = {"vc": "voce", "vcs": "voces", "ce": "voce", "pq": "porque", "q": "que", "tb": "tambem", "tbm": "tambem", "hj": "hoje", "n": "nao"}
+# Palavras que invertem o sentido; como os números, precisam coincidir entre as perguntas
+NEGACOES = frozenset(("nao", "nunca", "nenhum", "nenhuma", "ninguem", "nada"))
+# Também precisam coincidir: o que se pergunta ("quem" não é "o que") e quem faz o quê
+# ("quem te viu" não é "quem você viu")
+INTERROGATIVOS = frozenset(("quem", "que", "quando", "onde", "porque", "como", "qual", "quais", "quanto", "quantos", "quanta", "quantas"))
+PRONOMES = frozenset(("eu", "voce", "voces", "te", "ti", "mim", "comigo", "contigo", "ele", "ela", "eles", "elas", "nos", "lhe"))
+ESSENCIAIS = NEGACOES | INTERROGATIVOS | PRONOMES
+
+
+class CacheLRU:
+    """Cache de tamanho limitado com descarte do item menos usado recentemente"""
+
+    def __init__(self, tamanho_maximo=512):
+        self.tamanho_maximo = tamanho_maximo
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.falhas = 0
+
+    def obter(self, chave, padrao=None):
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                self.acertos += 1
+                return self._itens[chave]
+            self.falhas += 1
+            return padrao
+
+    def guardar(self, chave, valor):
+        with self._lock:
+            self._itens[chave] = valor
+            self._itens.move_to_end(chave)
+            while len(self._itens) > self.tamanho_maximo:
+                self._itens.popitem(last=False)
+
+    def __contains__(self, chave):
+        with self._lock:
+            return chave in self._itens
+
+    def __len__(self):
+        return len(self._itens)
+
+    def limpar(self):
+        with self._lock:
+            self._itens.clear()
+            self.acertos = 0
+            self.falhas = 0
+
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        return {
+            "itens": len(self._itens),
+            "tamanho_maximo": self.tamanho_maximo,
+            "acertos": self.acertos,
+            "falhas": self.falhas,
+            "taxa_acerto": self.acertos / total if total else 0.0,
+        }
+
+
+def normalizar_texto(texto):
+    """Sem acentos, caixa, pontuação, abreviações e palavras vazias"""
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    texto = texto.replace("por que", "porque")
+    palavras = (ABREVIACOES.get(p, p) for p in re.findall(r"[a-z0-9]+", texto))
+    return " ".join(p for p in palavras if p not in PALAVRAS_VAZIAS)
+
+
+def _ngramas(texto, n=3):
+    texto = f" {texto} "
+    return frozenset(texto[i:i + n] for i in range(len(texto) - n + 1))
+
+
+def _nomes_proprios(pergunta):
+    # Palavras com inicial maiúscula fora do começo da frase ("com Ana", "do Dr. Souza")
+    nomes = set()
+    for frase in re.split(r"[.!?]+", pergunta):
+        for palavra in re.findall(r"\w+", frase)[1:]:
+            if palavra[0].isupper():
+                nomes.update(normalizar_texto(palavra).split())
+    return nomes
+
+
+def _essenciais(pergunta, normalizada):
+    palavras = {p for p in normalizada.split() if p in ESSENCIAIS or any(c.isdigit() for c in p)}
+    return frozenset(palavras | _nomes_proprios(pergunta))
+
+
+class CacheSemelhantes:
+    """Respostas por escopo (ex.: caso e suspeito), achadas também por perguntas parecidas
+
+    As perguntas são normalizadas e comparadas pela semelhança de Jaccard dos trigramas de
+    caracteres; um índice invertido de trigramas limita a comparação às perguntas que têm
+    algo em comum. Números, negações, palavras interrogativas, pronomes e nomes próprios
+    precisam coincidir ("às 22h" não responde "às 23h", "quem" não responde "o que").
+    """
+
+    def __init__(self, limiar=0.7, tamanho_maximo=1024, por_escopo=64):
+        self.limiar = limiar
+        self.tamanho_maximo = tamanho_maximo
+        self.por_escopo = por_escopo
+        # escopo -> {"perguntas": [(normalizada, trigramas, essenciais, resposta)], "indice": {trigrama: {posição}}}
+        self._escopos = OrderedDict()
+        self._lock = threading.Lock()
+        self.acertos = 0
+        self.acertos_semelhantes = 0
+        self.falhas = 0
+
+    def _buscar(self, escopo, normalizada, trigramas, essenciais):
+        dados = self._escopos.get(escopo)
+        if dados is None:
+            return None, 0.0
+        self._escopos.move_to_end(escopo)
+        comuns = Counter()
+        for trigrama in trigramas:
+            comuns.update(dados["indice"].get(trigrama, ()))
+        melhor, similaridade = None, 0.0
+        for posicao, quantidade in comuns.items():
+            outra, outros_trigramas, outros_essenciais, resposta = dados["perguntas"][posicao]
+            if outra == normalizada:
+                return resposta, 1.0
+            if outros_essenciais != essenciais:
+                continue
+            jaccard = quantidade / (len(trigramas) + len(outros_trigramas) - quantidade)
+            if jaccard > similaridade:
+                melhor, similaridade = resposta, jaccard
+        return melhor, similaridade
+
+    def obter(self, escopo, pergunta):
+        """Resposta já dada a esta pergunta ou a uma parecida o bastante, ou None"""
+        normalizada = normalizar_texto(pergunta)
+        trigramas = _ngramas(normalizada)
+        with self._lock:
+            resposta, similaridade = self._buscar(escopo, normalizada, trigramas, _essenciais(pergunta, normalizada))
+            if resposta is not None and similaridade >= self.limiar:
+                self.acertos += 1
+                if similaridade < 1.0:
+                    self.acertos_semelhantes += 1
+                return resposta
+            self.falhas += 1
+            return None
+
+    def guardar(self, escopo, pergunta, resposta):
+        normalizada = normalizar_texto(pergunta)
+        trigramas = _ngramas(normalizada)
+        essenciais = _essenciais(pergunta, normalizada)
+        with self._lock:
+            dados = self._escopos.get(escopo)
+            if dados is None:
+                dados = self._escopos[escopo] = {"perguntas": [], "indice": {}}
+                while len(self._escopos) > self.tamanho_maximo:
+                    self._escopos.popitem(last=False)
+            self._escopos.move_to_end(escopo)
+            if any(outra == normalizada for outra, _, _, _ in dados["perguntas"]):
+                return
+            perguntas = dados["perguntas"]
+            perguntas.append((normalizada, trigramas, essenciais, resposta))
+            if len(perguntas) > self.por_escopo:
+                # Escopo cheio: sai a pergunta mais antiga e o índice é refeito (poucas dezenas de itens)
+                del perguntas[0]
+                dados["indice"] = {}
+                for posicao, (_, outros_trigramas, _, _) in enumerate(perguntas):
+                    for trigrama in outros_trigramas:
+                        dados["indice"].setdefault(trigrama, set()).add(posicao)
+            else:
+                for trigrama in trigramas:
+                    dados["indice"].setdefault(trigrama, set()).add(len(perguntas) - 1)
+
+    def __contains__(self, item):
+        """(escopo, pergunta) in cache: consulta sem contar acerto nem falha"""
+        escopo, pergunta = item
+        normalizada = normalizar_texto(pergunta)
+        with self._lock:
+            resposta, similaridade = self._buscar(escopo, normalizada, _ngramas(normalizada), _essenciais(pergunta, normalizada))
+        return resposta is not None and similaridade >= self.limiar
+
+    def __len__(self):
+        return sum(len(d["perguntas"]) for d in self._escopos.values())
+
+    def limpar(self):
+        with self._lock:
+            self._escopos.clear()
+            self.acertos = 0
+            self.acertos_semelhantes = 0
+            self.falhas = 0
+
+    def estatisticas(self):
+        total = self.acertos + self.falhas
+        return {
+            "escopos": len(self._escopos),
+            "perguntas": len(self),
+            "limiar": self.limiar,
+            "acertos": self.acertos,
+            "acertos_semelhantes": self.acertos_semelhantes,
+            "falhas": self.falhas,
+            "taxa_acerto": self.acertos / total if total else 0.0,
+        }
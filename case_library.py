@@ -0,0 +1,265 @@
+"""Biblioteca de casos prontos: pacotes com milhares de casos, lidos sem gerar nada
+
+Um pacote são dois arquivos com o mesmo nome-base:
+    <nome>.jsonl  uma linha por caso: {"modo": ..., "caso": {...}}
+    <nome>.idx    índice binário: grupos por (modo, elenco), posição de cada linha no
+                  .jsonl e uma tabela hash por id
+
+Os dois são abertos com mmap; carregar por id ou sortear um caso de um modo/elenco lê só
+os bytes daquele caso, então custa o mesmo num pacote de dez ou de cem mil casos.
+
+    python case_library.py gerar --quantidade 200 --modo normal rapido --saida novos.jsonl
+    python case_library.py construir novos.jsonl detetives.db --saida biblioteca
+    python case_library.py info biblioteca
+"""
+import argparse
+import hashlib
+import json
+import mmap
+import os
+import random
+import sqlite3
+import struct
+import sys
+import time
+
+from case_model import Caso
+from case_pool import MODOS
+
+ASSINATURA = b"DETCASOS"
+VERSAO = 1
+# Assinatura, versão, casos, grupos, posições da tabela hash
+CABECALHO = struct.Struct("<8sHIII")
+# Modo (índice em MODOS), tamanho do elenco, primeiro registro, quantidade
+GRUPO = struct.Struct("<BBII")
+# Posição e tamanho da linha do caso no .jsonl
+REGISTRO = struct.Struct("<QI")
+# Chave de 64 bits do id e número do registro + 1 (0 marca posição vazia)
+POSICAO = struct.Struct("<QI")
+SEM_MODO = 255
+
+
+def _chave(caso_id):
+    return int.from_bytes(hashlib.blake2b(caso_id.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _codigo_modo(modo):
+    return MODOS.index(modo) if modo in MODOS else SEM_MODO
+
+
+def _mapear(caminho):
+    with open(caminho, "rb") as f:
+        # mmap não aceita arquivos vazios
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+class BibliotecaCasos:
+    """Leitura de um pacote de casos; segura para várias sessões ao mesmo tempo"""
+
+    def __init__(self, caminho):
+        self.caminho = caminho
+        self._dados = _mapear(caminho + ".jsonl")
+        self._indice = _mapear(caminho + ".idx")
+        assinatura, versao, self._total, total_grupos, self._posicoes = CABECALHO.unpack_from(self._indice, 0)
+        if assinatura != ASSINATURA or versao != VERSAO:
+            raise ValueError(f"{caminho}.idx não é um índice de casos na versão {VERSAO}")
+        inicio = CABECALHO.size
+        # Os grupos são poucos (modos x tamanhos de elenco) e ficam em memória
+        self._grupos = [GRUPO.unpack_from(self._indice, inicio + i * GRUPO.size) for i in range(total_grupos)]
+        self._inicio_registros = inicio + total_grupos * GRUPO.size
+        self._inicio_tabela = self._inicio_registros + self._total * REGISTRO.size
+
+    def __len__(self):
+        return self._total
+
+    def _ler(self, registro):
+        posicao, tamanho = REGISTRO.unpack_from(self._indice, self._inicio_registros + registro * REGISTRO.size)
+        linha = json.loads(self._dados[posicao:posicao + tamanho])
+        return Caso.de_dict(linha["caso"])
+
+    def carregar(self, caso_id):
+        """Caso com esse id, ou None"""
+        if not self._total:
+            return None
+        chave = _chave(caso_id)
+        mascara = self._posicoes - 1
+        posicao = chave & mascara
+        # Sondagem linear; a tabela tem ao menos o dobro de posições que casos
+        while True:
+            chave_salva, registro = POSICAO.unpack_from(self._indice, self._inicio_tabela + posicao * POSICAO.size)
+            if not registro:
+                return None
+            if chave_salva == chave:
+                caso = self._ler(registro - 1)
+                if caso.id == caso_id:
+                    return caso
+            posicao = (posicao + 1) & mascara
+
+    def sortear(self, modo=None, elenco=None, aleatorio=random):
+        """Caso aleatório do modo e com o número de personagens pedidos (None = qualquer)"""
+        codigo = None if modo is None else _codigo_modo(modo)
+        grupos = [(primeiro, quantidade) for m, e, primeiro, quantidade in self._grupos
+                  if (codigo is None or m == codigo) and (elenco is None or e == elenco)]
+        total = sum(quantidade for _, quantidade in grupos)
+        if not total:
+            return None
+        sorteado = aleatorio.randrange(total)
+        for primeiro, quantidade in grupos:
+            if sorteado < quantidade:
+                return self._ler(primeiro + sorteado)
+            sorteado -= quantidade
+
+    def elencos(self, modo=None):
+        """Tamanhos de elenco disponíveis, para montar o filtro na tela"""
+        codigo = None if modo is None else _codigo_modo(modo)
+        return sorted({e for m, e, _, _ in self._grupos if codigo is None or m == codigo})
+
+    def estatisticas(self):
+        grupos = {}
+        for m, e, _, quantidade in self._grupos:
+            nome = MODOS[m] if m < len(MODOS) else "?"
+            grupos[f"{nome}/{e}"] = quantidade
+        return {"casos": self._total, "grupos": grupos, "bytes": len(self._dados) + len(self._indice)}
+
+    def fechar(self):
+        for arquivo in (self._dados, self._indice):
+            if isinstance(arquivo, mmap.mmap):
+                arquivo.close()
+
+
+def construir_pacote(casos, destino):
+    """Grava o pacote 'destino' a partir de (caso, modo); ids repetidos entram uma vez só.
+    Devolve quantos casos foram gravados."""
+    registros = []
+    vistos = set()
+    with open(destino + ".jsonl.tmp", "wb") as dados:
+        for caso, modo in casos:
+            if caso.id in vistos:
+                continue
+            vistos.add(caso.id)
+            linha = json.dumps({"modo": modo, "caso": caso.para_dict()}, ensure_ascii=False,
+                               separators=(",", ":")).encode("utf-8")
+            registros.append((_codigo_modo(modo), len(caso.personagens), dados.tell(), len(linha), _chave(caso.id)))
+            dados.write(linha + b"\n")
+
+    # Casos do mesmo (modo, elenco) ficam contíguos: sortear num grupo é só escolher um número
+    registros.sort(key=lambda r: (r[0], r[1]))
+    grupos = []
+    for i, (modo, elenco, _, _, _) in enumerate(registros):
+        if grupos and grupos[-1][:2] == [modo, elenco]:
+            grupos[-1][3] += 1
+        else:
+            grupos.append([modo, elenco, i, 1])
+    posicoes = 2
+    while posicoes < 2 * len(registros):
+        posicoes *= 2
+    tabela = [(0, 0)] * posicoes
+    for i, (_, _, _, _, chave) in enumerate(registros):
+        posicao = chave & (posicoes - 1)
+        while tabela[posicao][1]:
+            posicao = (posicao + 1) & (posicoes - 1)
+        tabela[posicao] = (chave, i + 1)
+
+    with open(destino + ".idx.tmp", "wb") as indice:
+        indice.write(CABECALHO.pack(ASSINATURA, VERSAO, len(registros), len(grupos), posicoes))
+        indice.write(b"".join(GRUPO.pack(*g) for g in grupos))
+        indice.write(b"".join(REGISTRO.pack(r[2], r[3]) for r in registros))
+        indice.write(b"".join(POSICAO.pack(*p) for p in tabela))
+    # Os dois só substituem o pacote anterior depois de completos; quem já o abriu segue
+    # lendo os arquivos antigos, que o mmap mantém vivos
+    os.replace(destino + ".jsonl.tmp", destino + ".jsonl")
+    os.replace(destino + ".idx.tmp", destino + ".idx")
+    return len(registros)
+
+
+def ler_casos(caminho):
+    """(caso, modo) de um .jsonl (de 'gerar' ou de outro pacote) ou do banco SQLite do jogo"""
+    if caminho.endswith(".db"):
+        conexao = sqlite3.connect(caminho)
+        try:
+            for dados, modo in conexao.execute("SELECT dados, modo FROM casos"):
+                yield Caso.de_json(dados), modo
+        finally:
+            conexao.close()
+        return
+    with open(caminho, encoding="utf-8") as f:
+        for numero, linha in enumerate(f, 1):
+            if not linha.strip():
+                continue
+            try:
+                dados = json.loads(linha)
+                yield Caso.de_dict(dados["caso"]), dados.get("modo")
+            except (ValueError, KeyError, TypeError) as e:
+                print(f"{caminho}:{numero}: ignorado ({e})", file=sys.stderr)
+
+
+def _gerar(args):
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from game_logic import gerar_caso, SEGUNDO_PLANO
+
+    modos = [args.modo[i % len(args.modo)] for i in range(args.quantidade)]
+    gerados = falhas = 0
+    with open(args.saida, "a", encoding="utf-8") as saida, ThreadPoolExecutor(max_workers=args.paralelo) as executor:
+        tarefas = {executor.submit(gerar_caso, modo, [], SEGUNDO_PLANO): modo for modo in modos}
+        for tarefa in as_completed(tarefas):
+            try:
+                caso = tarefa.result()
+            except Exception as e:
+                falhas += 1
+                print(f"falha: {e}", file=sys.stderr)
+                continue
+            saida.write(json.dumps({"modo": tarefas[tarefa], "caso": caso.para_dict()}, ensure_ascii=False,
+                                   separators=(",", ":")) + "\n")
+            saida.flush()
+            gerados += 1
+            print(f"\r{gerados}/{args.quantidade} casos ({falhas} falhas)", end="", file=sys.stderr)
+    print(file=sys.stderr)
+
+
+def _construir(args):
+    def todos():
+        for caminho in args.entradas:
+            yield from ler_casos(caminho)
+
+    inicio = time.perf_counter()
+    total = construir_pacote(todos(), args.saida)
+    print(f"{total} casos em {args.saida}.jsonl / {args.saida}.idx ({time.perf_counter() - inicio:.1f}s)")
+
+
+def _info(args):
+    biblioteca = BibliotecaCasos(args.pacote)
+    print(json.dumps(biblioteca.estatisticas(), ensure_ascii=False, indent=2))
+    if args.id:
+        caso = biblioteca.carregar(args.id)
+        print(caso.para_json() if caso else f"caso {args.id} não está no pacote")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    comandos = parser.add_subparsers(dest="comando", required=True)
+
+    gerar = comandos.add_parser("gerar", help="gera casos com o LLM e acrescenta ao .jsonl")
+    gerar.add_argument("--quantidade", type=int, default=10)
+    gerar.add_argument("--modo", nargs="+", choices=MODOS, default=list(MODOS), help="modos, em rodízio")
+    gerar.add_argument("--paralelo", type=int, default=4, help="casos gerados ao mesmo tempo")
+    gerar.add_argument("--saida", required=True, help="arquivo .jsonl (acrescenta se já existir)")
+    gerar.set_defaults(executar=_gerar)
+
+    construir = comandos.add_parser("construir", help="monta um pacote a partir de .jsonl e/ou bancos .db")
+    construir.add_argument("entradas", nargs="+")
+    construir.add_argument("--saida", required=True, help="nome-base do pacote, sem extensão")
+    construir.set_defaults(executar=_construir)
+
+    info = comandos.add_parser("info", help="resumo de um pacote")
+    info.add_argument("pacote", help="nome-base do pacote, sem extensão")
+    info.add_argument("--id", help="mostra também o caso com esse id")
+    info.set_defaults(executar=_info)
+
+    args = parser.parse_args()
+    args.executar(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+import json
+import hashlib
+from typing import List
+
+from pydantic import BaseModel, ConfigDict, PrivateAttr, ValidationError, model_validator
+
+# Quantidade aceita de itens por seção (mínimo, máximo)
+LIMITES = {
+    "personagens": (4, 6),
+    "locais": (3, 5),
+    "pistas": (5, 7),
+    "linha_tempo": (3, 5),
+}
+# Ordem de correção: as pistas dependem dos nomes dos locais
+SECOES = ("titulo", "introducao", "personagens", "locais", "pistas", "linha_tempo")
+
+
+def _verdadeiro(valor):
+    return valor is True or (isinstance(valor, str) and valor.strip().lower() == "true")
+
+
+def _itens_invalidos(itens, campos):
+    return [i for i, item in enumerate(itens)
+            if not isinstance(item, dict) or any(not isinstance(item.get(c), str) or not item.get(c).strip() for c in campos)]
+
+
+def validar_dados(dados):
+    """Confere o formato exigido do caso ainda em dict; devolve {seção: problema}"""
+    problemas = {}
+    for secao in ("titulo", "introducao"):
+        if not isinstance(dados.get(secao), str) or not dados[secao].strip():
+            problemas[secao] = "ausente ou vazio"
+    for secao, (minimo, maximo) in LIMITES.items():
+        itens = dados.get(secao)
+        if not isinstance(itens, list):
+            problemas[secao] = "ausente ou não é uma lista"
+        elif not minimo <= len(itens) <= maximo:
+            problemas[secao] = f"{len(itens)} itens (esperado de {minimo} a {maximo})"
+    if "personagens" not in problemas:
+        personagens = dados["personagens"]
+        if _itens_invalidos(personagens, ("nome", "descricao")):
+            problemas["personagens"] = "personagem sem nome ou descrição"
+        else:
+            culpados = sum(1 for p in personagens if _verdadeiro(p.get("culpado")))
+            if culpados != 1:
+                problemas["personagens"] = f"{culpados} culpados (esperado exatamente 1)"
+            elif len({p["nome"] for p in personagens}) != len(personagens):
+                problemas["personagens"] = "nomes repetidos"
+    if "locais" not in problemas and _itens_invalidos(dados["locais"], ("nome",)):
+        problemas["locais"] = "local sem nome"
+    if "pistas" not in problemas:
+        pistas = dados["pistas"]
+        if _itens_invalidos(pistas, ("descricao", "local")):
+            problemas["pistas"] = "pista sem descrição ou local"
+        elif "locais" not in problemas:
+            nomes_locais = {l["nome"] for l in dados["locais"]}
+            soltas = sorted({p["local"] for p in pistas if p["local"] not in nomes_locais})
+            if soltas:
+                problemas["pistas"] = f"locais inexistentes: {', '.join(soltas)}"
+    if "linha_tempo" not in problemas and not all(isinstance(e, str) and e.strip() for e in dados["linha_tempo"]):
+        problemas["linha_tempo"] = "evento vazio ou fora do formato texto"
+    return problemas
+
+
+class Personagem(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    nome: str
+    descricao: str = ""
+    motivacao: str = ""
+    culpado: bool = False
+
+
+class Local(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    nome: str
+    descricao: str = ""
+
+
+class Pista(BaseModel):
+    model_config = ConfigDict(frozen=True)
+
+    id: int
+    descricao: str
+    local: str
+    verdadeira: bool = True
+
+
+class Caso(BaseModel):
+    """Caso validado, com índices montados uma única vez para consultas O(1)"""
+
+    model_config = ConfigDict(frozen=True)
+
+    id: str = ""
+    titulo: str
+    introducao: str
+    personagens: List[Personagem]
+    locais: List[Local]
+    pistas: List[Pista]
+    linha_tempo: List[str] = []
+
+    _personagem_por_nome: dict = PrivateAttr(default_factory=dict)
+    _local_por_nome: dict = PrivateAttr(default_factory=dict)
+    _pistas_por_local: dict = PrivateAttr(default_factory=dict)
+    _pista_por_id: dict = PrivateAttr(default_factory=dict)
+
+    @model_validator(mode="before")
+    @classmethod
+    def _preparar(cls, dados):
+        # O LLM não numera as pistas nem calcula o id; ambos são derivados do conteúdo
+        if not isinstance(dados, dict):
+            return dados
+        dados = dict(dados)
+        dados['pistas'] = [
+            {**p, 'id': p.get('id', i)} if isinstance(p, dict) else p
+            for i, p in enumerate(dados.get('pistas') or [])
+        ]
+        if not dados.get('id'):
+            conteudo = json.dumps({k: v for k, v in dados.items() if k != 'id'}, sort_keys=True, ensure_ascii=False)
+            dados['id'] = hashlib.sha1(conteudo.encode("utf-8")).hexdigest()[:16]
+        return dados
+
+    def model_post_init(self, __context):
+        self._personagem_por_nome = {p.nome: p for p in self.personagens}
+        self._local_por_nome = {l.nome: l for l in self.locais}
+        self._pista_por_id = {p.id: p for p in self.pistas}
+        for pista in self.pistas:
+            self._pistas_por_local.setdefault(pista.local, []).append(pista)
+
+    def personagem(self, nome):
+        return self._personagem_por_nome.get(nome)
+
+    def local(self, nome):
+        return self._local_por_nome.get(nome)
+
+    def pista(self, id):
+        return self._pista_por_id.get(id)
+
+    def pistas_do_local(self, nome):
+        return self._pistas_por_local.get(nome, [])
+
+    @property
+    def culpado(self):
+        return next((p for p in self.personagens if p.culpado), None)
+
+    def para_dict(self):
+        return self.model_dump()
+
+    def para_json(self):
+        """Serialização compacta, própria para guardar na sessão ou em disco"""
+        return self.model_dump_json()
+
+    @classmethod
+    def de_dict(cls, dados):
+        try:
+            return cls.model_validate(dados)
+        except ValidationError as e:
+            raise ValueError(f"Caso inválido: {e.error_count()} erro(s) de formato") from e
+
+    @classmethod
+    def de_json(cls, texto):
+        return cls.model_validate_json(texto)
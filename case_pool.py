@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+from collections import deque
+
+MODOS = ("normal", "rapido", "classico")
+
+
+class PoolCasos:
+    """Estoque de casos já gerados e validados por modo, reabastecido em segundo plano"""
+
+    def __init__(self, gerar, profundidade=None, modos=MODOS):
+        # gerar(modo) deve devolver um caso pronto ou levantar exceção
+        self._gerar = gerar
+        if profundidade is None:
+            profundidade = int(os.getenv("POOL_CASOS_PROFUNDIDADE", "2"))
+        self.profundidade = profundidade
+        self._casos = {modo: deque() for modo in modos}
+        self._latencias = {modo: deque(maxlen=50) for modo in modos}
+        self._cond = threading.Condition()
+        self._thread = None
+        self._parar = False
+        self.retiradas = 0
+        self.vazios = 0
+        self.falhas = 0
+
+    def iniciar(self):
+        with self._cond:
+            if self.profundidade <= 0 or (self._thread and self._thread.is_alive()):
+                return
+            self._parar = False
+            self._thread = threading.Thread(target=self._reabastecer, name="pool-casos", daemon=True)
+            self._thread.start()
+
+    def parar(self):
+        with self._cond:
+            self._parar = True
+            self._cond.notify_all()
+
+    def _modo_mais_vazio(self):
+        modo = min(self._casos, key=lambda m: len(self._casos[m]))
+        return modo if len(self._casos[modo]) < self.profundidade else None
+
+    def _reabastecer(self):
+        espera_erro = 1.0
+        while True:
+            with self._cond:
+                modo = self._modo_mais_vazio()
+                while modo is None and not self._parar:
+                    self._cond.wait()
+                    modo = self._modo_mais_vazio()
+                if self._parar:
+                    return
+
+            inicio = time.perf_counter()
+            try:
+                caso = self._gerar(modo)
+            except Exception:
+                self.falhas += 1
+                # Evita martelar a API enquanto ela estiver falhando
+                time.sleep(espera_erro)
+                espera_erro = min(espera_erro * 2, 60.0)
+                continue
+            espera_erro = 1.0
+
+            with self._cond:
+                self._casos[modo].append(caso)
+                self._latencias[modo].append(time.perf_counter() - inicio)
+
+    def retirar(self, modo):
+        """Devolve um caso pronto do modo pedido, ou None se o estoque estiver vazio"""
+        with self._cond:
+            fila = self._casos.get(modo)
+            caso = fila.popleft() if fila else None
+            if caso is None:
+                self.vazios += 1
+            else:
+                self.retiradas += 1
+            self._cond.notify_all()
+        return caso
+
+    def estatisticas(self):
+        with self._cond:
+            modos = {}
+            for modo, fila in self._casos.items():
+                latencias = self._latencias[modo]
+                modos[modo] = {
+                    "profundidade": len(fila),
+                    "reposicao_ultima": latencias[-1] if latencias else None,
+                    "reposicao_media": sum(latencias) / len(latencias) if latencias else None,
+                }
+            return {
+                "profundidade_alvo": self.profundidade,
+                "retiradas": self.retiradas,
+                "vazios": self.vazios,
+                "falhas": self.falhas,
+                "modos": modos,
+            }
@@ -0,0 +1,75 @@
+import os
+from collections import deque
+
+# Orçamento de tokens da memória de cada suspeito no prompt
+MEMORIA_TOKENS = int(os.getenv("MEMORIA_TOKENS", "480"))
+# Parte do orçamento reservada ao resumo dos turnos antigos
+FRACAO_RESUMO = 0.4
+
+
+def estimar_tokens(texto):
+    # Aproximação usada quando o provedor não informa o uso (~4 caracteres por token)
+    return max(1, len(texto) // 4)
+
+
+def _encurtar(texto, limite):
+    texto = " ".join(texto.split())
+    return texto if len(texto) <= limite else texto[:limite - 1].rstrip() + "…"
+
+
+class MemoriaPersonagem:
+    """Memória da conversa com um suspeito: últimos turnos na íntegra e um resumo dos antigos
+
+    O total nunca passa de 'orcamento' tokens, por mais longo que seja o interrogatório.
+    """
+
+    def __init__(self, orcamento=MEMORIA_TOKENS):
+        self.orcamento_resumo = int(orcamento * FRACAO_RESUMO)
+        self.orcamento_recentes = orcamento - self.orcamento_resumo
+        self._resumo = deque()
+        self._tokens_resumo = 0
+        self._recentes = deque()
+        self._tokens_recentes = 0
+        # Quantos turnos do histórico já foram incorporados
+        self.turnos = 0
+
+    def adicionar(self, pergunta, resposta):
+        turno = f"Detetive: {pergunta}\nVocê: {resposta}"
+        if estimar_tokens(turno) > self.orcamento_recentes:
+            turno = _encurtar(turno, self.orcamento_recentes * 4)
+        tokens = estimar_tokens(turno)
+        self._recentes.append((turno, tokens, pergunta, resposta))
+        self._tokens_recentes += tokens
+        self.turnos += 1
+
+        # Turnos que não cabem mais na íntegra viram uma linha curta no resumo
+        while self._tokens_recentes > self.orcamento_recentes:
+            _, tokens, pergunta, resposta = self._recentes.popleft()
+            self._tokens_recentes -= tokens
+            linha = f"- {_encurtar(pergunta, 60)} → {_encurtar(resposta, 90)}"
+            self._resumo.append((linha, estimar_tokens(linha)))
+            self._tokens_resumo += self._resumo[-1][1]
+            while self._tokens_resumo > self.orcamento_resumo:
+                self._tokens_resumo -= self._resumo.popleft()[1]
+
+    def sincronizar(self, historico):
+        """Incorpora apenas os turnos do histórico que ainda não foram vistos"""
+        for turno in historico[self.turnos:]:
+            self.adicionar(turno["pergunta"], turno["resposta"])
+        return self
+
+    @property
+    def tokens(self):
+        return self._tokens_resumo + self._tokens_recentes
+
+    def contexto(self):
+        """Trecho de prompt com o que o suspeito já disse; vazio se a conversa ainda não começou"""
+        if not self.turnos:
+            return ""
+        partes = ["Conversa até agora (mantenha-se coerente com ela):"]
+        if self._resumo:
+            partes.append("Resumo do que já foi dito:")
+            partes.extend(linha for linha, _ in self._resumo)
+        partes.append("Últimas perguntas:")
+        partes.extend(turno for turno, _, _, _ in self._recentes)
+        return "\n".join(partes)
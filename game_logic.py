@@ -1,26 +1,145 @@
 import os
 import json
 import random
-from openai import OpenAI
-from dotenv import load_dotenv
 import re
+import time
+import difflib
+import threading
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from cache import CacheSemelhantes
+from case_model import Caso, LIMITES, SECOES, validar_dados
+from conversation_memory import estimar_tokens
+from prompts import prompts_do_caso
+import llm_gateway
+import metrics
+from llm_gateway import INTERATIVA, SEGUNDO_PLANO
 
-load_dotenv()
+# Respostas já dadas por (caso, personagem), achadas também por perguntas parecidas
+cache_interrogatorios = CacheSemelhantes(
+    limiar=float(os.getenv("CACHE_SIMILARIDADE", "0.7")),
+    tamanho_maximo=int(os.getenv("CACHE_INTERROGATORIOS", "1024"))
+)
 
-# Configuração da OpenRouter
-OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
-client = OpenAI(
-    base_url="https://openrouter.ai/api/v1",
-    api_key=OPENROUTER_API_KEY,
-    default_headers={
-        "HTTP-Referer": "https://github.com/Mogutaa/detetives-da-vez",
-        "X-Title": "Detetives da Vez"
-    }
+# Suspeitos interrogados ao mesmo tempo no interrogatório em grupo
+MAX_PARALELO_GRUPO = int(os.getenv("INTERROGATORIO_PARALELO", "6"))
+
+# Perguntas sugeridas ao escolher um suspeito; as respostas são geradas de antemão
+PERGUNTAS_SUGERIDAS = (
+    "Onde você estava na noite do crime?",
+    "Qual era a sua relação com a vítima?",
+    "O que você viu ou ouviu naquela noite?",
 )
-MODEL = "google/gemma-3-27b-it:free"
+# Respostas antecipadas geradas ao mesmo tempo, somando todas as sessões
+_antecipacao = ThreadPoolExecutor(
+    max_workers=int(os.getenv("ANTECIPACAO_PARALELO", "2")),
+    thread_name_prefix="antecipacao"
+)
+_antecipacao_lock = threading.Lock()
+# (escopo, resposta) antecipadas que o jogador ainda não usou, das mais antigas às mais novas;
+# guarda no máximo o que cabe no cache de interrogatórios, de onde as antigas já saíram
+_antecipadas = OrderedDict()
+# Antecipações ainda em andamento por (escopo, pergunta): (futuro, evento de desistência,
+# evento de chamada enviada); quem fizer a mesma pergunta espera pelas que já foram enviadas
+_em_andamento = {}
+estatisticas_antecipacao = {"disparadas": 0, "concluidas": 0, "canceladas": 0, "aproveitadas": 0}
+
+# Reperguntas de seções inválidas e tentativas completas por caso gerado
+MAX_REPERGUNTAS = int(os.getenv("CASO_MAX_REPERGUNTAS", "3"))
+MAX_GERACOES = int(os.getenv("CASO_MAX_GERACOES", "2"))
+
+# Custo da geração de casos: quantos precisaram de correção e quantos tokens foram gastos
+estatisticas_geracao = {
+    "casos_validos": 0,
+    "casos_descartados": 0,
+    "casos_corrigidos": 0,
+    "reperguntas": 0,
+    "tokens": 0,
+}
+# Casos são montados por várias threads ao mesmo tempo (sessões e o pool)
+_geracao_lock = threading.Lock()
+
+class RespostaStream:
+    """Itera sobre os trechos de uma resposta, medindo o primeiro token e o tempo total"""
+
+    def __init__(self, operacao, trechos, ao_concluir=None, registrar=True, uso=None, tokens_prompt=None):
+        self.operacao = operacao
+        self.tokens_prompt = tokens_prompt
+        # Tokens informados pelo provedor, preenchidos pelo gateway durante o stream
+        self.uso = uso if uso is not None else {}
+        self._trechos = trechos
+        self._ao_concluir = ao_concluir
+        self._registrar = registrar
+        self.ttft = None
+        self.latencia_total = None
+        self.texto = None
+
+    def __iter__(self):
+        inicio = time.perf_counter()
+        partes = []
+        try:
+            for trecho in self._trechos:
+                if not trecho:
+                    continue
+                if self.ttft is None:
+                    self.ttft = time.perf_counter() - inicio
+                partes.append(trecho)
+                yield trecho
+        except llm_gateway.Desistencia:
+            # Desistiu antes de enviar: não houve chamada nem erro
+            raise
+        except Exception as e:
+            if self._registrar:
+                metrics.registrar(self.operacao, time.perf_counter() - inicio, self.ttft, erro=e)
+            raise
+        self.latencia_total = time.perf_counter() - inicio
+        self.texto = "".join(partes)
+        if self._registrar:
+            if self.uso.get("prompt_tokens"):
+                self.tokens_prompt = self.uso["prompt_tokens"]
+            metrics.registrar(
+                self.operacao,
+                self.latencia_total,
+                self.ttft,
+                tokens_prompt=self.tokens_prompt,
+                tokens_completion=self.uso.get("completion_tokens") or estimar_tokens(self.texto),
+                tokens_prompt_cache=self.uso.get("cached_tokens")
+            )
+        if self._ao_concluir:
+            self._ao_concluir(self.texto)
+
+    def fechar(self):
+        """Abandona o stream no meio; o gateway fecha a conexão e libera a vaga"""
+        close = getattr(self._trechos, "close", None)
+        if close:
+            close()
+
+    def texto_completo(self):
+        """Consome o stream, se ainda não foi consumido, e devolve o texto final"""
+        if self.texto is None:
+            for _ in self:
+                pass
+        return self.texto
+
+def _stream_llm(prompt, prioridade=INTERATIVA, operacao="llm", **params):
+    """Gera os trechos de texto da resposta conforme chegam da OpenRouter
+
+    'prompt' é o texto de uma única mensagem ou a lista de mensagens de um Prompt.
+    """
+    return llm_gateway.completar_stream(
+        prompt if isinstance(prompt, list) else [{"role": "user", "content": prompt}],
+        prioridade=prioridade,
+        operacao=operacao,
+        **params
+    )
+
+def normalizar_pergunta(pergunta):
+    """Normaliza caixa, espaços e pontuação final para comparar perguntas repetidas"""
+    return re.sub(r"\s+", " ", pergunta).strip().rstrip("?!. ").lower()
 
 def extrair_json(texto):
-    """Tenta extrair um bloco JSON de uma string"""
+    """Tenta extrair um bloco JSON de uma string, reparando-o se preciso"""
     try:
         # Tenta encontrar o primeiro bloco de texto entre {}
         inicio = texto.index('{')
@@ -28,10 +147,71 @@ def extrair_json(texto):
         json_str = texto[inicio:fim+1]
         return json.loads(json_str)
     except (ValueError, json.JSONDecodeError):
-        return None
+        return reparar_json(texto)
+
+def reparar_json(texto):
+    """Recupera um objeto JSON com vírgulas sobrando ou cortado no meio (ex.: resposta truncada)"""
+    inicio = texto.find('{')
+    if inicio < 0:
+        return None
+    saida = []
+    pilha = []
+    # Posições em que o texto pode ser cortado e fechado com segurança, com a pilha da época
+    pontos_seguros = []
+    em_string = escape = fechado = False
+    for c in texto[inicio:]:
+        if em_string:
+            saida.append(c)
+            if escape:
+                escape = False
+            elif c == '\\':
+                escape = True
+            elif c == '"':
+                em_string = False
+            continue
+        if c == '"':
+            em_string = True
+            saida.append(c)
+        elif c in '{[':
+            pilha.append('}' if c == '{' else ']')
+            saida.append(c)
+            pontos_seguros.append((len(saida), tuple(pilha)))
+        elif c in '}]':
+            # Vírgula sobrando antes do fechamento
+            while saida and saida[-1].isspace():
+                saida.pop()
+            if saida and saida[-1] == ',':
+                saida.pop()
+            saida.append(pilha.pop())
+            if not pilha:
+                fechado = True
+                break
+        elif c == ',':
+            pontos_seguros.append((len(saida), tuple(pilha)))
+            saida.append(c)
+        else:
+            saida.append(c)
+
+    candidatos = []
+    if fechado:
+        candidatos.append("".join(saida))
+    else:
+        # Primeiro tenta só fechar o que ficou aberto; depois recua até um ponto seguro
+        final = "".join(saida) + ('"' if em_string else '')
+        candidatos.append(re.sub(r"[\s,:]*$", "", final) + "".join(reversed(pilha)))
+        for tamanho, pilha_antiga in reversed(pontos_seguros[-20:]):
+            candidatos.append("".join(saida[:tamanho]) + "".join(reversed(pilha_antiga)))
+    for candidato in candidatos:
+        try:
+            dados = json.loads(candidato)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(dados, dict):
+            return dados
+    return None
 
-def gerar_caso(modo="normal", nomes_jogadores=[]):
-    prompt = f"""
+def _prompt_caso(modo, nomes_jogadores):
+    return f"""
     ## Instruções
     Crie um caso de mistério completo seguindo EXATAMENTE o formato JSON abaixo.
     NÃO inclua nenhum texto adicional além do JSON.
@@ -76,70 +256,471 @@ def gerar_caso(modo="normal", nomes_jogadores=[]):
     - Linha do tempo com 3 a 5 eventos
     
     Modo: {modo}
-    {f"Nomes dos jogadores como personagens: {', '.join(nomes_jogadores)}" if nomes_jogadores else ""}
-    """
-    
-    # ... (restante do código permanece igual) ...
-
-def interrogar_personagem(personagem, pergunta, caso):
-    char_info = next((c for c in caso['personagens'] if c['nome'] == personagem), None)
-    if not char_info:
-        return "Personagem não encontrado"
-    
-    prompt = f"""
-    Você é {personagem} ({char_info['descricao']}). 
-    Motivação oculta: {char_info.get('motivacao', '')}
-    {'Você é o culpado!' if char_info.get('culpado', False) else 'Você é inocente.'}
-    
-    Responda à pergunta do detetive de forma breve e natural, mantendo seu personagem:
-    "{pergunta}"
+    {f"Nomes dos jogadores como personagens: {', '.join(nomes_jogadores)}" if nomes_jogadores else ""}
     """
-    
-    response = client.chat.completions.create(
-        model=MODEL,
-        messages=[{"role": "user", "content": prompt}]
+
+def gerar_caso_stream(modo="normal", nomes_jogadores=[], prioridade=INTERATIVA):
+    """Stream do texto bruto (JSON) do caso; use montar_caso com o stream consumido"""
+    uso = {}
+    return RespostaStream(
+        "gerar_caso",
+        _stream_llm(_prompt_caso(modo, nomes_jogadores), prioridade, "gerar_caso", json_mode=True, uso=uso),
+        uso=uso
     )
-    
-    return response.choices[0].message.content
 
-def avaliar_teoria(teoria, caso):
-    prompt = f"""
-    Avalie esta teoria sobre o caso '{caso['titulo']}':
-    "{teoria}"
-    
-    Informações reais (em JSON):
-    {json.dumps(caso, indent=2)}
-    
-    Responda com:
-    - "CORRETO" se a teoria estiver totalmente correta
-    - "INCORRETO" caso contrário
-    - Uma narrativa de desfecho
-    - Explicação breve dos acertos/erros (sem revelar detalhes não descobertos)
+def _tokens_gastos(uso, texto_prompt, texto_resposta):
+    if uso.get("prompt_tokens") or uso.get("completion_tokens"):
+        return uso.get("prompt_tokens", 0) + uso.get("completion_tokens", 0)
+    return estimar_tokens(texto_prompt) + estimar_tokens(texto_resposta)
+
+def _prompt_secao(secao, dados, problema, modo):
+    regras = {
+        "titulo": "um título criativo (use emojis quando apropriado)",
+        "introducao": "uma introdução envolvente com o cenário do crime",
+        "personagens": "lista de {0} a {1} objetos com nome, descricao, motivacao e culpado (true em exatamente um)",
+        "locais": "lista de {0} a {1} objetos com nome e descricao",
+        "pistas": "lista de {0} a {1} objetos com descricao, local (um dos nomes em 'locais') e verdadeira (algumas false)",
+        "linha_tempo": "lista de {0} a {1} eventos em texto",
+    }
+    regra = regras[secao].format(*LIMITES.get(secao, (0, 0)))
+    # Só o que a seção precisa para ficar coerente com o resto do caso
+    contexto = {k: v for k, v in dados.items() if k != secao and k in SECOES}
+    return (
+        f"Este caso de mistério (modo {modo}) tem um problema na seção '{secao}': {problema}.\n"
+        f"Reescreva SOMENTE essa seção: {regra}.\n"
+        f'Responda apenas com um objeto JSON no formato {{"{secao}": ...}}.\n'
+        f"Caso atual: {json.dumps(contexto, ensure_ascii=False, separators=(',', ':'))}"
+    )
+
+def _regerar_secao(secao, dados, problema, modo, prioridade):
+    """Pede ao modelo apenas a seção inválida; devolve (nova seção ou None, tokens gastos)"""
+    prompt = _prompt_secao(secao, dados, problema, modo)
+    uso = {}
+    try:
+        resposta = llm_gateway.completar(
+            [{"role": "user", "content": prompt}],
+            prioridade=prioridade,
+            operacao="reparar_secao",
+            json_mode=True,
+            uso=uso
+        )
+        texto = resposta.choices[0].message.content or ""
+    except Exception:
+        return None, estimar_tokens(prompt)
+    corrigido = extrair_json(texto)
+    tokens = _tokens_gastos(uso, prompt, texto)
+    if not corrigido or secao not in corrigido:
+        return None, tokens
+    return corrigido[secao], tokens
+
+def montar_caso(texto, modo="normal", prioridade=INTERATIVA, tokens=0):
+    """Valida o caso gerado, corrigindo seções inválidas com reperguntas pontuais"""
+    dados = extrair_json(texto)
+    if dados is None:
+        _contar_geracao(casos_descartados=1, tokens=tokens)
+        raise ValueError("A IA não retornou um caso em JSON válido")
+
+    problemas = validar_dados(dados)
+    reperguntas = 0
+    while problemas and reperguntas < MAX_REPERGUNTAS:
+        secao = next(s for s in SECOES if s in problemas)
+        reperguntas += 1
+        nova_secao, gastos = _regerar_secao(secao, dados, problemas[secao], modo, prioridade)
+        tokens += gastos
+        if nova_secao is not None:
+            dados[secao] = nova_secao
+        problemas = validar_dados(dados)
+
+    if problemas:
+        _contar_geracao(reperguntas=reperguntas, tokens=tokens, casos_descartados=1)
+        raise ValueError("Caso inválido: " + "; ".join(f"{s}: {p}" for s, p in problemas.items()))
+    _contar_geracao(reperguntas=reperguntas, tokens=tokens, casos_validos=1, casos_corrigidos=1 if reperguntas else 0)
+    return Caso.de_dict(dados)
+
+def _contar_geracao(**incrementos):
+    with _geracao_lock:
+        for chave, valor in incrementos.items():
+            estatisticas_geracao[chave] += valor
+
+def metricas_geracao():
+    """Taxa de regeneração e tokens gastos por caso válido"""
+    with _geracao_lock:
+        dados = dict(estatisticas_geracao)
+    validos = dados["casos_validos"]
+    tentados = validos + dados["casos_descartados"]
+    dados["taxa_regeneracao"] = (dados["casos_corrigidos"] + dados["casos_descartados"]) / tentados if tentados else 0.0
+    dados["tokens_por_caso_valido"] = dados["tokens"] / validos if validos else None
+    return dados
+
+def _nomes_validos(nomes_jogadores, personagens):
+    """Nomes não vazios e sem repetição, que não coincidam com um suspeito que fica no caso"""
+    nomes = []
+    for nome in nomes_jogadores:
+        nome = " ".join(nome.split())
+        if nome and nome.casefold() not in {n.casefold() for n in nomes}:
+            nomes.append(nome)
+    # Cada nome descartado muda quem fica no caso, então repete até estabilizar
+    while True:
+        restantes = {p.nome.casefold() for p in personagens[len(nomes):]}
+        validos = [n for n in nomes if n.casefold() not in restantes]
+        if validos == nomes:
+            return nomes[:len(personagens)]
+        nomes = validos
+
+def aplicar_jogadores(caso, nomes_jogadores):
+    """Troca os primeiros personagens de um caso pronto pelos nomes dos jogadores
+
+    Se a troca deixar o caso inválido (ex.: nomes repetidos), o caso volta sem alteração.
+    """
+    trocas = list(zip([c.nome for c in caso.personagens], _nomes_validos(nomes_jogadores, caso.personagens)))
+    if not trocas:
+        return caso
+    primeiros = [c.nome.split()[0] for c in caso.personagens]
+    texto = json.dumps(caso.model_dump(exclude={'id'}), ensure_ascii=False)
+    # Marcadores intermediários evitam trocar de novo um nome que acabou de ser inserido;
+    # os limites de palavra evitam trocar "Rosa" dentro de "Rosana"
+    for i, (antigo, _) in enumerate(trocas):
+        marcador = f"\u0000{i}\u0000"
+        texto = re.sub(rf"\b{re.escape(antigo)}\b", marcador, texto)
+        primeiro = antigo.split()[0]
+        if primeiro != antigo and primeiros.count(primeiro) == 1:
+            texto = re.sub(rf"\b{re.escape(primeiro)}\b", marcador, texto)
+    for i, (_, novo) in enumerate(trocas):
+        texto = texto.replace(f"\u0000{i}\u0000", json.dumps(novo, ensure_ascii=False)[1:-1])
+    dados = json.loads(texto)
+    if validar_dados(dados):
+        return caso
+    return Caso.de_dict(dados)
+
+def montar_caso_do_stream(stream, modo="normal", prioridade=INTERATIVA):
+    """montar_caso a partir de um stream de gerar_caso_stream já consumido"""
+    tokens = _tokens_gastos(stream.uso, _prompt_caso(modo, []), stream.texto)
+    return montar_caso(stream.texto, modo, prioridade, tokens)
+
+def gerar_caso(modo="normal", nomes_jogadores=[], prioridade=INTERATIVA):
+    for tentativa in range(MAX_GERACOES):
+        stream = gerar_caso_stream(modo, nomes_jogadores, prioridade)
+        stream.texto_completo()
+        try:
+            return montar_caso_do_stream(stream, modo, prioridade)
+        except ValueError:
+            # Só uma resposta irrecuperável justifica gerar o caso inteiro de novo
+            if tentativa == MAX_GERACOES - 1:
+                raise
+
+def interrogar_personagem_stream(personagem, pergunta, caso, memoria=None, prioridade=INTERATIVA, operacao="interrogatorio"):
+    """Resposta do suspeito; 'memoria' (MemoriaPersonagem) traz o que ele já disse nesta conversa"""
+    escopo = (caso.id, personagem)
+    # Uma pergunta igual ou parecida repete o que o suspeito já disse, sem chamar o LLM
+    resposta = cache_interrogatorios.obter(escopo, pergunta)
+    if resposta is not None:
+        metrics.contar(operacao, "cache_acertos")
+        with _antecipacao_lock:
+            if (escopo, resposta) in _antecipadas:
+                del _antecipadas[(escopo, resposta)]
+                estatisticas_antecipacao["aproveitadas"] += 1
+        return RespostaStream(operacao, [resposta], registrar=False)
+
+    # A mesma pergunta já está sendo respondida em segundo plano. Se a chamada já foi enviada,
+    # espera por ela em vez de pagar outra que poderia dar outra versão da história; se ainda
+    # está na fila (do executor ou do agendador), desiste dela e pergunta com a prioridade do jogador
+    with _antecipacao_lock:
+        futuro, desistir, enviada = _em_andamento.get((escopo, pergunta), (None, None, None))
+        if futuro is not None and not enviada.is_set():
+            desistir.set()
+    if futuro is not None and enviada.is_set():
+        alternativa = lambda: _interrogar_llm(personagem, pergunta, caso, memoria, prioridade, operacao)
+        return RespostaStream(operacao, _esperar_antecipada(futuro, escopo, operacao, alternativa), registrar=False)
+    if futuro is not None:
+        # Fora do lock: o callback de conclusão do futuro também o usa
+        if futuro.cancel():
+            with _antecipacao_lock:
+                estatisticas_antecipacao["canceladas"] += 1
+        llm_gateway.agendador.acordar()
+    return _interrogar_llm(personagem, pergunta, caso, memoria, prioridade, operacao)
+
+def _esperar_antecipada(futuro, escopo, operacao, alternativa):
+    texto = futuro.result()
+    if not texto:
+        # Cancelada ou com erro: faz a chamada normal
+        yield from alternativa()
+        return
+    metrics.contar(operacao, "cache_acertos")
+    with _antecipacao_lock:
+        _antecipadas.pop((escopo, texto), None)
+        estatisticas_antecipacao["aproveitadas"] += 1
+    yield texto
+
+def _interrogar_llm(personagem, pergunta, caso, memoria, prioridade, operacao, **params):
+    escopo = (caso.id, personagem)
+    # Ficha e fatos do caso são o prefixo fixo; a memória e a pergunta vão no sufixo
+    prompt = prompts_do_caso(caso).interrogatorio(personagem)
+    if prompt is None:
+        return RespostaStream("interrogatorio", ["Personagem não encontrado"], registrar=False)
+    contexto = memoria.contexto() if memoria else ""
+    sufixo = f"{contexto}\n\n" if contexto else ""
+    sufixo += f'Pergunta do detetive: "{pergunta}"'
+
+    def guardar(texto):
+        if texto:
+            cache_interrogatorios.guardar(escopo, pergunta, texto)
+
+    uso = {}
+    return RespostaStream(
+        operacao,
+        _stream_llm(prompt.mensagens(sufixo), prioridade, operacao, uso=uso, **params),
+        ao_concluir=guardar,
+        uso=uso,
+        tokens_prompt=prompt.tokens(sufixo)
+    )
+
+def _consumir_antecipada(escopo, resposta, desistir):
+    """Devolve o texto da resposta, ou None se ela foi cancelada ou falhou"""
+    try:
+        # O gateway confere 'desistir' enquanto espera vaga; entre os trechos, conferimos aqui
+        for _ in resposta:
+            if desistir.is_set():
+                resposta.fechar()
+                raise llm_gateway.Desistencia()
+    except llm_gateway.Desistencia:
+        with _antecipacao_lock:
+            estatisticas_antecipacao["canceladas"] += 1
+        return None
+    except Exception:
+        return None
+    with _antecipacao_lock:
+        estatisticas_antecipacao["concluidas"] += 1
+        _antecipadas[(escopo, resposta.texto)] = None
+        while len(_antecipadas) > cache_interrogatorios.tamanho_maximo:
+            _antecipadas.popitem(last=False)
+    return resposta.texto
+
+def _marcar_enviada(desistir, enviada):
+    # Chamado pelo gateway ao obter a vaga; sob o lock, para não cruzar com quem desiste
+    with _antecipacao_lock:
+        if not desistir.is_set():
+            enviada.set()
+
+def _encerrar_antecipada(chave, futuro):
+    with _antecipacao_lock:
+        if _em_andamento.get(chave, (None,))[0] is futuro:
+            del _em_andamento[chave]
+
+class LoteAntecipado:
+    """Respostas antecipadas disparadas juntas; cada uma tem o próprio evento de desistência"""
+
+    def __init__(self):
+        self.eventos = []
+
+    def cancelar(self):
+        """Desiste do que não terminou; o que ainda espera vaga sai sem fazer a chamada"""
+        for evento in self.eventos:
+            evento.set()
+        llm_gateway.agendador.acordar()
+
+def antecipar_respostas(personagem, caso, memoria=None, limite=len(PERGUNTAS_SUGERIDAS)):
+    """Gera em segundo plano as respostas das perguntas sugeridas que ainda não estão no cache
+
+    Devolve (LoteAntecipado, quantidade disparada). As respostas vão para o cache de
+    interrogatórios, então clicar na sugestão é instantâneo.
+    """
+    lote = LoteAntecipado()
+    escopo = (caso.id, personagem)
+    with _antecipacao_lock:
+        em_andamento = {p for (e, p) in _em_andamento if e == escopo}
+    pendentes = [
+        p for p in PERGUNTAS_SUGERIDAS
+        if p not in em_andamento and (escopo, p) not in cache_interrogatorios
+    ][:max(0, limite)]
+    for pergunta in pendentes:
+        desistir = threading.Event()
+        enviada = threading.Event()
+        lote.eventos.append(desistir)
+        # O prompt (com a memória da sessão) é montado aqui; a thread só consome o stream
+        resposta = _interrogar_llm(
+            personagem, pergunta, caso, memoria, SEGUNDO_PLANO, "antecipacao",
+            desistir=desistir, ao_adquirir=lambda d=desistir, e=enviada: _marcar_enviada(d, e)
+        )
+        chave = (escopo, pergunta)
+        with _antecipacao_lock:
+            futuro = _antecipacao.submit(_consumir_antecipada, escopo, resposta, desistir)
+            _em_andamento[chave] = (futuro, desistir, enviada)
+        futuro.add_done_callback(lambda f, chave=chave: _encerrar_antecipada(chave, f))
+    with _antecipacao_lock:
+        estatisticas_antecipacao["disparadas"] += len(pendentes)
+    return lote, len(pendentes)
+
+def metricas_antecipacao():
+    with _antecipacao_lock:
+        dados = dict(estatisticas_antecipacao)
+    dados["taxa_aproveitamento"] = dados["aproveitadas"] / dados["concluidas"] if dados["concluidas"] else 0.0
+    return dados
+
+def lembrar_respostas(caso, interrogatorios):
+    """Põe no cache as respostas de uma sessão retomada, para que o suspeito não se contradiga"""
+    for personagem, turnos in interrogatorios.items():
+        for turno in turnos:
+            cache_interrogatorios.guardar((caso.id, personagem), turno["pergunta"], turno["resposta"])
+
+def interrogar_personagem(personagem, pergunta, caso, memoria=None):
+    return interrogar_personagem_stream(personagem, pergunta, caso, memoria).texto_completo()
+
+def interrogar_grupo(pergunta, caso, memorias=None):
+    """Faz a mesma pergunta a todos os suspeitos de uma vez
+
+    Gera (nome, resposta, erro) na ordem em que as respostas ficam prontas; 'resposta' é a
+    RespostaStream já consumida. Os prompts (e as memórias) são montados aqui, na thread de
+    quem chama; as threads do pool só consomem os streams.
     """
-    
-    response = client.chat.completions.create(
-        model=MODEL,
-        messages=[{"role": "user", "content": prompt}]
+    memorias = memorias or {}
+    respostas = {
+        p.nome: interrogar_personagem_stream(p.nome, pergunta, caso, memorias.get(p.nome))
+        for p in caso.personagens
+    }
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, min(MAX_PARALELO_GRUPO, len(respostas))),
+        thread_name_prefix="interrogatorio-grupo"
     )
-    
-    return response.choices[0].message.content
-
-def gerar_resumo(caso, pistas, interrogatorios):
-    prompt = f"""
-    Resuma o caso '{caso['titulo']}' para os detetives:
-    - Pistas encontradas: {', '.join(p['descricao'][:50] for p in pistas)}
-    - Interrogatórios realizados: {len(interrogatorios)} personagens
-    
-    Destaque:
-    - Contradições importantes
-    - Pontos-chave ainda não resolvidos
-    - Possíveis teorias (sem revelar o culpado)
-    - Sugestões de próximos passos
+    try:
+        futuros = {executor.submit(resposta.texto_completo): nome for nome, resposta in respostas.items()}
+        for futuro in as_completed(futuros):
+            nome = futuros[futuro]
+            erro = futuro.exception()
+            yield nome, respostas[nome], erro
+    finally:
+        # Se quem consome desistir no meio (ex.: rerun), o que não começou é descartado
+        executor.shutdown(wait=False, cancel_futures=True)
+
+def _sem_acentos(texto):
+    texto = unicodedata.normalize("NFKD", texto)
+    return "".join(c for c in texto if not unicodedata.combining(c)).lower().strip()
+
+def resolver_acusado(acusacao, caso, corte=0.75):
+    """Encontra o personagem acusado pelo nome, tolerando acentos, erros de digitação e nomes parciais"""
+    exato = caso.personagem(acusacao.strip())
+    if exato:
+        return exato
+    alvo = _sem_acentos(acusacao)
+    partes = []
+    for personagem in caso.personagens:
+        nome = _sem_acentos(personagem.nome)
+        if alvo == nome:
+            return personagem
+        partes.append([nome] + [p for p in nome.split() if len(p) >= 3])
+
+    def nomeados(trecho):
+        # Suspeitos com a melhor nota para o trecho, se ela passar do corte; mais de um
+        # quando dividem o nome ("Albuquerque")
+        notas = [max(difflib.SequenceMatcher(None, trecho, p).ratio() for p in ps) for ps in partes]
+        melhor = max(notas, default=0)
+        return {i for i, nota in enumerate(notas) if nota >= corte and nota == melhor}
+
+    # Cada palavra que nomeia alguém restringe os candidatos: "Helna Albuquerque" fica só com
+    # Helena, e palavras que apontam para suspeitos diferentes ("Ana ou Ricardo",
+    # "Rosa, Ana, Helena, Ricardo") não deixam ninguém
+    candidatos = None
+    for palavra in [p for p in re.findall(r"\w+", alvo) if len(p) >= 3]:
+        apontados = nomeados(palavra)
+        if apontados:
+            candidatos = apontados if candidatos is None else candidatos & apontados
+    if candidatos is None:
+        candidatos = nomeados(alvo)
+    # Ninguém, ou um nome que mais de um tem, não é uma acusação clara
+    if len(candidatos) != 1:
+        return None
+    return caso.personagens[candidatos.pop()]
+
+def verificar_acusacao(acusacao, caso):
+    """Veredito local e instantâneo: devolve (personagem acusado ou None, acusação correta)"""
+    acusado = resolver_acusado(acusacao, caso)
+    return acusado, bool(acusado and acusado.culpado)
+
+def _desfecho_padrao(acusado, correto):
+    if correto:
+        return f"{acusado.nome} é desmascarado(a) diante de todos e confessa o crime. Caso encerrado!"
+    return f"{acusado.nome} tem um álibi sólido. O verdadeiro culpado continua à solta..."
+
+def _com_alternativa(trechos, alternativa):
+    """Repassa os trechos do LLM; se a chamada falhar antes de começar, usa o texto alternativo"""
+    iniciado = False
+    try:
+        for trecho in trechos:
+            iniciado = True
+            yield trecho
+    except Exception:
+        if iniciado:
+            raise
+        yield alternativa
+
+def narrar_desfecho_stream(acusado, correto, caso):
+    """Narrativa de encerramento; o veredito já foi decidido localmente"""
+    contexto = {"acusado": acusado.nome, "descricao": acusado.descricao, "correto": correto}
+    if correto:
+        contexto["motivacao"] = acusado.motivacao
+    prompt = prompts_do_caso(caso).desfecho
+    sufixo = json.dumps(contexto, ensure_ascii=False, separators=(",", ":"))
+    return RespostaStream(
+        "avaliar_teoria",
+        _com_alternativa(_stream_llm(prompt.mensagens(sufixo), operacao="avaliar_teoria"), _desfecho_padrao(acusado, correto)),
+        tokens_prompt=prompt.tokens(sufixo)
+    )
+
+def avaliar_teoria(teoria, caso):
+    """Devolve (acusação correta, narrativa do desfecho)"""
+    acusado, correto = verificar_acusacao(teoria, caso)
+    if acusado is None:
+        return False, "Nenhum suspeito corresponde a esse nome."
+    return correto, narrar_desfecho_stream(acusado, correto, caso).texto_completo()
+
+def marca_resumo(pistas, interrogatorios):
+    """Até onde um resumo vai: quantas pistas e quantos turnos de cada suspeito ele já cobre"""
+    return {
+        "pistas": len(pistas),
+        "turnos": {nome: len(turnos) for nome, turnos in interrogatorios.items()},
+    }
+
+def _novidades(pistas, interrogatorios, marca):
+    # Pistas e turnos só crescem no fim das listas; a marca diz onde o resumo anterior parou
+    marca = marca or {"pistas": 0, "turnos": {}}
+    novas_pistas = pistas[marca["pistas"]:]
+    novos_turnos = {
+        nome: turnos[marca["turnos"].get(nome, 0):]
+        for nome, turnos in interrogatorios.items()
+        if len(turnos) > marca["turnos"].get(nome, 0)
+    }
+    return novas_pistas, novos_turnos
+
+def gerar_resumo_stream(caso, pistas, interrogatorios, resumo_anterior=None, marca=None):
+    """Atualiza o resumo anterior só com o que mudou desde 'marca' (ver marca_resumo)
+
+    Sem novidades, devolve o resumo anterior sem chamar o LLM.
     """
-    
-    response = client.chat.completions.create(
-        model=MODEL,
-        messages=[{"role": "user", "content": prompt}]
+    if not resumo_anterior:
+        marca = None
+    novas_pistas, novos_turnos = _novidades(pistas, interrogatorios, marca)
+    if resumo_anterior and not novas_pistas and not novos_turnos:
+        metrics.contar("gerar_resumo", "cache_acertos")
+        return RespostaStream("gerar_resumo", [resumo_anterior], registrar=False)
+
+    linhas = [f"- Pista ({p.local}): {p.descricao}" for p in novas_pistas]
+    for nome, turnos in novos_turnos.items():
+        for turno in turnos:
+            linhas.append(f"- {nome}, perguntado \"{turno['pergunta'][:120]}\", disse: {turno['resposta'][:300]}")
+    novidades = "\n".join(linhas) or "- Nenhuma pista ou depoimento ainda."
+    # Instruções e fatos do caso são o prefixo fixo; só o resumo anterior e as novidades mudam
+    prompt = prompts_do_caso(caso).resumo
+    if resumo_anterior:
+        sufixo = f"Resumo anterior:\n{resumo_anterior}\n\nNovidades desde então:\n{novidades}"
+    else:
+        sufixo = f"Pistas e depoimentos até agora:\n{novidades}"
+
+    uso = {}
+    return RespostaStream(
+        "gerar_resumo",
+        _stream_llm(prompt.mensagens(sufixo), SEGUNDO_PLANO, "gerar_resumo", uso=uso),
+        uso=uso,
+        tokens_prompt=prompt.tokens(sufixo)
     )
-    
-    return response.choices[0].message.content
\ No newline at end of file
+
+def gerar_resumo(caso, pistas, interrogatorios, resumo_anterior=None, marca=None):
+    return gerar_resumo_stream(caso, pistas, interrogatorios, resumo_anterior, marca).texto_completo()
\ No newline at end of file
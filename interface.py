@@ -1,7 +1,59 @@
 from datetime import timedelta
 import streamlit as st
-from game_logic import interrogar_personagem, gerar_resumo, avaliar_teoria
+from game_logic import (
+    interrogar_personagem_stream, interrogar_grupo, antecipar_respostas, gerar_resumo_stream, marca_resumo,
+    verificar_acusacao, narrar_desfecho_stream, cache_interrogatorios, PERGUNTAS_SUGERIDAS
+)
+from state_manager import (
+    registrar_pista, registrar_interrogatorio, resposta_registrada, memoria_de, salvar_sessao, definir,
+    sincronizar_sala, obter_biblioteca, carregar_da_biblioteca
+)
+from json_stream import LeitorJSONIncremental
+from metrics import medir
+import metrics
+import os
 import random
+import tempfile
+import threading
+import time
+import urllib.request
+
+# Intervalo (segundos) da consulta de novidades numa sala compartilhada
+SALA_INTERVALO = float(os.getenv("SALA_INTERVALO", "3"))
+IMAGEM_INICIAL_URL = "https://images.unsplash.com/photo-1549082984-1323b94df9a6?ixlib=rb-4.0.3&auto=format&fit=crop&w=600&q=80"
+# Cópia local da imagem da tela inicial; baixada uma vez se ainda não existir
+IMAGEM_INICIAL = os.getenv("IMAGEM_INICIAL", os.path.join(tempfile.gettempdir(), "detetives_cena_do_crime.jpg"))
+
+_imagem = None
+_download_imagem = None
+
+def _baixar_imagem():
+    try:
+        with urllib.request.urlopen(IMAGEM_INICIAL_URL, timeout=10) as resposta:
+            dados = resposta.read()
+        temporario = IMAGEM_INICIAL + ".tmp"
+        with open(temporario, "wb") as f:
+            f.write(dados)
+        os.replace(temporario, IMAGEM_INICIAL)
+    except OSError:
+        pass
+
+def imagem_inicial():
+    """Bytes da imagem da tela inicial, lidos do disco uma vez por processo
+
+    Sem a cópia local, a tela usa a URL remota enquanto a cópia é baixada em segundo plano:
+    a primeira renderização de um processo novo não espera pela rede.
+    """
+    global _imagem, _download_imagem
+    if _imagem is None:
+        if not os.path.exists(IMAGEM_INICIAL):
+            if _download_imagem is None:
+                _download_imagem = threading.Thread(target=_baixar_imagem, name="imagem-inicial", daemon=True)
+                _download_imagem.start()
+            return IMAGEM_INICIAL_URL
+        with open(IMAGEM_INICIAL, "rb") as f:
+            _imagem = f.read()
+    return _imagem
 
 # Estilos CSS personalizados
 def aplicar_estilos():
@@ -143,6 +195,42 @@ def aplicar_estilos():
     </style>
     """, unsafe_allow_html=True)
 
+def exibir_stream(stream, formatar=None, temporario=False, aguardando=None):
+    """Renderiza os tokens conforme chegam e devolve o texto final"""
+    espaco = st.empty()
+    if aguardando:
+        espaco.caption(f"⏳ {aguardando}")
+    texto = ""
+    for trecho in stream:
+        texto += trecho
+        conteudo = texto + "▌"
+        espaco.markdown(formatar(conteudo) if formatar else conteudo, unsafe_allow_html=formatar is not None)
+    if temporario:
+        espaco.empty()
+    else:
+        espaco.markdown(formatar(texto) if formatar else texto, unsafe_allow_html=formatar is not None)
+    if stream.ttft is not None and stream.latencia_total is not None:
+        prompt = f" · prompt ~{stream.tokens_prompt} tokens" if stream.tokens_prompt else ""
+        st.caption(f"⏱️ Primeiro token em {stream.ttft:.2f}s · resposta completa em {stream.latencia_total:.2f}s{prompt}")
+    return texto
+
+def _escolhas_tela_inicial():
+    modo = st.session_state.modo_escolhido
+    nomes = st.session_state.nomes_jogadores
+    modo = "rapido" if "Rápido" in modo else "classico" if "Clássico" in modo else "normal"
+    return modo, [n.strip() for n in nomes.split(",") if n.strip()] if nomes else []
+
+def _comecar_caso():
+    # Callback: roda antes do script, então o clique já vai direto para o caso
+    st.session_state.modo_jogo, st.session_state.jogadores = _escolhas_tela_inicial()
+    st.session_state.caso = None  # Será gerado
+
+def _carregar_da_biblioteca():
+    modo, jogadores = _escolhas_tela_inicial()
+    elenco = st.session_state.elenco_biblioteca
+    if not carregar_da_biblioteca(modo, jogadores, None if elenco == "Qualquer" else elenco):
+        st.toast("📚 Nenhum caso da biblioteca combina com esse modo e número de suspeitos")
+
 def mostrar_tela_inicial():
     aplicar_estilos()
     
@@ -156,128 +244,256 @@ def mostrar_tela_inicial():
     """)
     st.markdown("</div>", unsafe_allow_html=True)
     
-    st.image("https://images.unsplash.com/photo-1549082984-1323b94df9a6?ixlib=rb-4.0.3&auto=format&fit=crop&w=600&q=80", 
-             caption="Cena do crime", use_column_width=True)
+    st.image(imagem_inicial(), caption="Cena do crime", use_column_width=True)
     
     with st.container():
         col1, col2 = st.columns(2)
         with col1:
             st.subheader("⚙️ Modo de Jogo")
-            modo = st.radio("", ["Normal", "Rápido (10 min)", "Clássico"], label_visibility="collapsed")
+            st.radio("", ["Normal", "Rápido (10 min)", "Clássico"], key="modo_escolhido", label_visibility="collapsed")
         with col2:
             st.subheader("👤 Jogadores")
-            nomes = st.text_input("Nomes (separados por vírgula):", label_visibility="collapsed")
+            st.text_input("Nomes (separados por vírgula):", key="nomes_jogadores", label_visibility="collapsed")
     
     st.markdown("<div class='custom-card'>", unsafe_allow_html=True)
-    if st.button("▶️ Começar Novo Caso", use_container_width=True, type="primary"):
-        st.session_state.modo_jogo = "rapido" if "Rápido" in modo else "classico" if "Clássico" in modo else "normal"
-        st.session_state.jogadores = [n.strip() for n in nomes.split(",")] if nomes else []
-        st.session_state.caso = None  # Será gerado
-        st.rerun()
+    st.button("▶️ Começar Novo Caso", on_click=_comecar_caso, use_container_width=True, type="primary")
+    biblioteca = obter_biblioteca()
+    if biblioteca is not None and len(biblioteca):
+        # Casos prontos do pacote: abrem na hora e não gastam nada com o LLM
+        with st.expander(f"📚 Biblioteca ({len(biblioteca)} casos prontos)"):
+            st.selectbox("Suspeitos", ["Qualquer"] + biblioteca.elencos(), key="elenco_biblioteca")
+            st.button("📚 Carregar caso da biblioteca", on_click=_carregar_da_biblioteca, use_container_width=True)
     st.markdown("</div>", unsafe_allow_html=True)
 
+def _cabecalho_caso(titulo):
+    return f"<div class='custom-card'><h1>🔍 Caso: {titulo}</h1></div>"
+
+def mostrar_caso_em_geracao(stream):
+    """Mostra o caso enquanto o JSON chega: introdução primeiro, abas liberadas seção a seção"""
+    aplicar_estilos()
+    leitor = LeitorJSONIncremental()
+
+    cabecalho = st.empty()
+    cabecalho.markdown(_cabecalho_caso("⏳ ..."), unsafe_allow_html=True)
+    introducao = st.empty()
+    tab1, tab2, tab3, tab4 = st.tabs(["🗺️ Explorar Locais", "👥 Interrogar Suspeitos", "📝 Pistas Coletadas", "🧠 Painel do Detetive"])
+    espacos = {}
+    for secao, tab in (("locais", tab1), ("personagens", tab2), ("pistas", tab3), ("linha_tempo", tab4)):
+        with tab:
+            espacos[secao] = st.empty()
+            espacos[secao].info("⏳ Esta parte do caso ainda está sendo escrita...")
+
+    for trecho in stream:
+        for chave, valor in leitor.alimentar(trecho):
+            if chave == "titulo":
+                cabecalho.markdown(_cabecalho_caso(valor), unsafe_allow_html=True)
+            elif chave == "introducao":
+                with introducao.container():
+                    with st.expander("ℹ️ Introdução do Caso", expanded=True):
+                        st.markdown(f"<div style='padding: 15px;'>{valor}</div>", unsafe_allow_html=True)
+            elif chave in ("locais", "personagens") and isinstance(valor, list):
+                with espacos[chave].container():
+                    for item in valor:
+                        if isinstance(item, dict):
+                            st.markdown(f"**{item.get('nome', '?')}** — {item.get('descricao', '')}")
+                    st.caption("🔒 Disponível assim que o caso terminar de ser montado.")
+            elif chave == "pistas" and isinstance(valor, list):
+                espacos[chave].info(f"🔒 {len(valor)} pistas escondidas pelos locais. Explore para encontrá-las!")
+            elif chave == "linha_tempo":
+                espacos[chave].success("✅ Caso pronto! Preparando o painel do detetive...")
+    return leitor.campos
+
 def mostrar_caso(caso):
     aplicar_estilos()
     
     # Cabeçalho do caso
-    st.markdown(f"<div class='custom-card'><h1>🔍 Caso: {caso['titulo']}</h1></div>", unsafe_allow_html=True)
+    st.markdown(_cabecalho_caso(caso.titulo), unsafe_allow_html=True)
     
     with st.expander("ℹ️ Introdução do Caso", expanded=True):
-        st.markdown(f"<div style='padding: 15px;'>{caso['introducao']}</div>", unsafe_allow_html=True)
+        st.markdown(f"<div style='padding: 15px;'>{caso.introducao}</div>", unsafe_allow_html=True)
     
     # Layout principal com abas
     tab1, tab2, tab3, tab4 = st.tabs(["🗺️ Explorar Locais", "👥 Interrogar Suspeitos", "📝 Pistas Coletadas", "🧠 Painel do Detetive"])
     
+    aviso = st.session_state.pop("aviso_pista", None)
+    if aviso:
+        st.toast(aviso)
+    
+    # Cada aba é um fragmento: um clique nela refaz só a própria aba,
+    # sem reenviar o CSS, o cabeçalho e as outras três
     with tab1:
+        _aba_locais(caso)
+    with tab2:
+        _aba_suspeitos(caso)
+    with tab3:
+        _aba_pistas(caso)
+    with tab4:
+        _aba_painel(caso)
+
+@st.fragment
+def _aba_locais(caso):
+    with medir("render_aba_locais"):
         st.markdown("<div class='custom-card'>", unsafe_allow_html=True)
         st.subheader("Locais para Investigar")
         st.caption("Clique em um local para explorar e procurar pistas.")
         
         cols = st.columns(2)
-        for i, local in enumerate(caso['locais']):
+        for i, local in enumerate(caso.locais):
             with cols[i % 2]:
-                if st.button(f"🔍 {local['nome']}", key=f"loc_{local['nome']}", use_container_width=True):
-                    st.session_state.local_atual = local
+                if st.button(f"🔍 {local.nome}", key=f"loc_{local.nome}", use_container_width=True):
+                    st.session_state.local_atual = local.nome
         st.markdown("</div>", unsafe_allow_html=True)
                 
-        if st.session_state.local_atual:
+        local_atual = caso.local(st.session_state.local_atual) if st.session_state.local_atual else None
+        if local_atual:
             st.markdown("<div class='custom-card'>", unsafe_allow_html=True)
-            st.subheader(f"🔎 {st.session_state.local_atual['nome']}")
-            st.write(st.session_state.local_atual['descricao'])
+            st.subheader(f"🔎 {local_atual.nome}")
+            st.write(local_atual.descricao)
             
             # Botões para ações no local
             col1, col2 = st.columns(2)
             with col1:
                 if st.button("🔦 Procurar pistas", key="procurar_pistas", use_container_width=True):
                     # Encontra uma pista não descoberta associada a este local
-                    pistas_local = [p for p in caso['pistas'] if p['local'] == st.session_state.local_atual['nome']]
-                    if pistas_local:
-                        pista = random.choice(pistas_local)
-                        if pista not in st.session_state.pistas_descobertas:
-                            st.session_state.pistas_descobertas.append(pista)
-                            st.toast(f"🔎 Pista encontrada: {pista['descricao'][:50]}...")
+                    pistas_local = caso.pistas_do_local(local_atual.nome)
+                    novas = [p for p in pistas_local if p.id not in st.session_state.pistas_ids]
+                    if novas:
+                        pista = random.choice(novas)
+                        registrar_pista(pista)
+                        # A aba de pistas também muda: só aqui vale refazer a página inteira
+                        st.session_state.aviso_pista = f"🔎 Pista encontrada: {pista.descricao[:50]}..."
+                        st.rerun()
+                    elif pistas_local:
+                        st.info("Você já encontrou todas as pistas deste local.")
                     else:
                         st.warning("Nenhuma pista encontrada aqui.")
             with col2:
                 if st.button("↩️ Voltar", key="voltar_local", use_container_width=True):
                     st.session_state.local_atual = None
             st.markdown("</div>", unsafe_allow_html=True)
-    
-    with tab2:
+
+@st.fragment
+def _aba_suspeitos(caso):
+    with medir("render_aba_suspeitos"):
         st.markdown("<div class='custom-card'>", unsafe_allow_html=True)
         st.subheader("Lista de Suspeitos")
         st.caption("Clique em um suspeito para interrogar.")
         
         cols = st.columns(2)
-        for i, personagem in enumerate(caso['personagens']):
+        for i, personagem in enumerate(caso.personagens):
             with cols[i % 2]:
                 emoji = "👤"
-                if personagem.get('culpado', False):
+                if personagem.culpado:
                     emoji = "👤"
-                elif "governant" in personagem['descricao'].lower():
+                elif "governant" in personagem.descricao.lower():
                     emoji = "👤"
-                elif "jardineir" in personagem['descricao'].lower():
+                elif "jardineir" in personagem.descricao.lower():
                     emoji = "👤"
                     
-                if st.button(f"{emoji} {personagem['nome']}", key=f"char_{personagem['nome']}", use_container_width=True):
-                    st.session_state.suspeito_atual = personagem
+                if st.button(f"{emoji} {personagem.nome}", key=f"char_{personagem.nome}", use_container_width=True):
+                    st.session_state.suspeito_atual = personagem.nome
+                    _antecipar(caso, personagem.nome)
         st.markdown("</div>", unsafe_allow_html=True)
+        
+        with st.expander("🗣️ Interrogatório em Grupo", expanded=False):
+            pergunta_grupo = st.text_input("Pergunta para todos os suspeitos:", key="pergunta_grupo", placeholder="O que você viu às 22h?")
+            if st.button("📣 Perguntar a todos", key="interrogar_grupo", use_container_width=True) and pergunta_grupo:
+                _interrogar_grupo(caso, pergunta_grupo)
                 
-        if st.session_state.suspeito_atual:
+        p = caso.personagem(st.session_state.suspeito_atual) if st.session_state.suspeito_atual else None
+        if p:
             st.markdown("<div class='custom-card'>", unsafe_allow_html=True)
-            p = st.session_state.suspeito_atual
-            st.subheader(f"🎭 {p['nome']}")
-            st.caption(p['descricao'])
+            st.subheader(f"🎭 {p.nome}")
+            st.caption(p.descricao)
+            
+            # Perguntas sugeridas; ⚡ marca as que já têm resposta pronta
+            cols = st.columns(len(PERGUNTAS_SUGERIDAS))
+            for i, sugestao in enumerate(PERGUNTAS_SUGERIDAS):
+                pronta = ((caso.id, p.nome), sugestao) in cache_interrogatorios
+                cols[i].button(
+                    f"⚡ {sugestao}" if pronta else sugestao,
+                    key=f"sugestao_{i}",
+                    on_click=st.session_state.update,
+                    kwargs={"pergunta_input": sugestao},
+                    use_container_width=True
+                )
             
             # Campo para perguntas
             pergunta = st.text_input("Faça uma pergunta:", key="pergunta_input", placeholder="Onde você estava na noite do crime?")
             
             if pergunta:
-                with st.spinner(f"{p['nome']} está pensando..."):
-                    resposta = interrogar_personagem(p['nome'], pergunta, caso)
-                
-                # Resposta com estilo
-                st.markdown(f"""
+                formatar = lambda texto: f"""
                 <div style="background: #2d3436; border-radius: 10px; padding: 15px; margin-top: 15px;">
-                    <div style="color: var(--primary); font-weight: bold;">{p['nome']}:</div>
-                    <div style="margin-top: 8px;">{resposta}</div>
+                    <div style="color: var(--primary); font-weight: bold;">{p.nome}:</div>
+                    <div style="margin-top: 8px;">{texto}</div>
                 </div>
-                """, unsafe_allow_html=True)
-                
-                # Registrar interrogatório
-                if p['nome'] not in st.session_state.interrogatorios:
-                    st.session_state.interrogatorios[p['nome']] = []
-                st.session_state.interrogatorios[p['nome']].append({
-                    "pergunta": pergunta,
-                    "resposta": resposta
-                })
+                """
+                # Reruns mantêm o texto no campo: uma pergunta já registrada mostra a resposta do
+                # histórico, sem passar pelo cache (e sem contar como acerto dele)
+                registrada = resposta_registrada(p.nome, pergunta)
+                if registrada is not None:
+                    st.markdown(formatar(registrada), unsafe_allow_html=True)
+                else:
+                    # Resposta com estilo, preenchida conforme os tokens chegam
+                    resposta = exibir_stream(
+                        interrogar_personagem_stream(p.nome, pergunta, caso, memoria_de(p.nome)),
+                        aguardando=f"{p.nome} está pensando...",
+                        formatar=formatar
+                    )
+                    if registrar_interrogatorio(p.nome, pergunta, resposta):
+                        salvar_sessao()
                 
             # Botão para voltar
             if st.button("↩️ Voltar para lista de suspeitos", key="voltar_suspeito", use_container_width=True):
                 st.session_state.suspeito_atual = None
+                _cancelar_antecipacao()
             st.markdown("</div>", unsafe_allow_html=True)
-    
-    with tab3:
+
+def _cancelar_antecipacao():
+    antecipacao = st.session_state.get("_antecipacao")
+    if antecipacao is not None:
+        antecipacao[1].cancelar()
+        st.session_state._antecipacao = None
+
+def _antecipar(caso, nome):
+    """Começa a gerar as respostas sugeridas do suspeito escolhido, dentro do orçamento da sessão"""
+    antecipacao = st.session_state.get("_antecipacao")
+    if antecipacao is not None and antecipacao[0] == (caso.id, nome):
+        # Mesmo suspeito de novo: as respostas dele continuam sendo geradas
+        return
+    _cancelar_antecipacao()
+    restante = st.session_state.antecipacoes_restantes
+    if restante <= 0:
+        return
+    lote, disparadas = antecipar_respostas(nome, caso, memoria_de(nome), restante)
+    st.session_state.antecipacoes_restantes = restante - disparadas
+    st.session_state._antecipacao = ((caso.id, nome), lote)
+
+def _interrogar_grupo(caso, pergunta):
+    """Pergunta a todos ao mesmo tempo e preenche cada resposta assim que ela chega"""
+    espacos = {}
+    for personagem in caso.personagens:
+        espacos[personagem.nome] = st.empty()
+        espacos[personagem.nome].caption(f"⏳ {personagem.nome} está pensando...")
+    memorias = {p.nome: memoria_de(p.nome) for p in caso.personagens}
+    inicio = time.perf_counter()
+    soma = 0.0
+    novos = False
+    for nome, resposta, erro in interrogar_grupo(pergunta, caso, memorias):
+        if erro is not None:
+            espacos[nome].error(f"{nome} não respondeu: {erro}")
+            continue
+        espacos[nome].markdown(f"**{nome}:** {resposta.texto}")
+        soma += resposta.latencia_total or 0
+        # Registro na thread da sessão, na ordem de chegada
+        novos = registrar_interrogatorio(nome, pergunta, resposta.texto) or novos
+    st.caption(f"⏱️ Todas as respostas em {time.perf_counter() - inicio:.2f}s (somadas: {soma:.2f}s)")
+    if novos:
+        salvar_sessao()
+
+@st.fragment
+def _aba_pistas(caso):
+    with medir("render_aba_pistas"):
         st.markdown("<div class='custom-card'>", unsafe_allow_html=True)
         st.subheader("Pistas Encontradas")
         st.caption(f"Total de pistas: {len(st.session_state.pistas_descobertas)}")
@@ -285,29 +501,45 @@ def mostrar_caso(caso):
         if not st.session_state.pistas_descobertas:
             st.info("🔍 Nenhuma pista encontrada ainda. Explore os locais!")
         else:
-            for i, pista in enumerate(st.session_state.pistas_descobertas):
+            for i, pista_id in enumerate(st.session_state.pistas_descobertas):
+                pista = caso.pista(pista_id)
                 emoji = "🔎"
-                if not pista.get('verdadeira', True):
+                if not pista.verdadeira:
                     emoji = "❓"
                 
-                with st.expander(f"{emoji} Pista #{i+1}: {pista['descricao'][:50]}...", expanded=False):
-                    st.markdown(f"**Local encontrado:** {pista.get('local', '?')}")
-                    st.markdown(f"**Descrição completa:** {pista['descricao']}")
+                with st.expander(f"{emoji} Pista #{i+1}: {pista.descricao[:50]}...", expanded=False):
+                    st.markdown(f"**Local encontrado:** {pista.local}")
+                    st.markdown(f"**Descrição completa:** {pista.descricao}")
         st.markdown("</div>", unsafe_allow_html=True)
-    
-    with tab4:
+
+@st.fragment
+def _aba_painel(caso):
+    with medir("render_aba_painel"):
         st.markdown("<div class='custom-card'>", unsafe_allow_html=True)
         st.subheader("Ferramentas do Detetive")
         
         # Resumo do caso
         with st.expander("📋 Solicitar Resumo do Caso", expanded=False):
             if st.button("🧠 Gerar Resumo", key="gerar_resumo", use_container_width=True):
-                with st.spinner("Analisando o caso..."):
-                    st.session_state.resumo = gerar_resumo(
-                        caso, 
-                        st.session_state.pistas_descobertas,
-                        st.session_state.interrogatorios
+                pistas = [caso.pista(i) for i in st.session_state.pistas_descobertas]
+                marca = marca_resumo(pistas, st.session_state.interrogatorios)
+                if st.session_state.resumo and marca == st.session_state.resumo_marca:
+                    st.caption("Nada de novo desde o último resumo.")
+                else:
+                    # Só as pistas e depoimentos novos vão ao modelo, junto com o resumo anterior
+                    resumo = exibir_stream(
+                        gerar_resumo_stream(
+                            caso, 
+                            pistas,
+                            st.session_state.interrogatorios,
+                            st.session_state.resumo,
+                            st.session_state.resumo_marca
+                        ),
+                        temporario=True,
+                        aguardando="Analisando o caso..."
                     )
+                    # Numa sala, o resumo passa a valer para o grupo todo
+                    definir(resumo=resumo, resumo_marca=marca)
             if "resumo" in st.session_state:
                 st.subheader("Resumo do Caso")
                 st.write(st.session_state.resumo)
@@ -323,9 +555,18 @@ def mostrar_caso(caso):
             with col1:
                 if st.button("✅ Confirmar Acusação", key="fazer_acusacao", type="primary", use_container_width=True):
                     if acusacao:
-                        with st.spinner("Avaliando acusação..."):
+                        # O veredito é decidido localmente; o LLM só escreve o desfecho
+                        acusado, correto = verificar_acusacao(acusacao, caso)
+                        if acusado is None:
+                            st.error("Nenhum suspeito com esse nome. Confira a lista de suspeitos.")
+                        else:
                             try:
-                                st.session_state.resultado_acusacao = avaliar_teoria(acusacao, caso)
+                                resultado = exibir_stream(
+                                    narrar_desfecho_stream(acusado, correto, caso),
+                                    temporario=True,
+                                    aguardando="Avaliando acusação..."
+                                )
+                                definir(resultado_acusacao=resultado, acusacao_correta=correto)
                             except Exception as e:
                                 st.error(f"Erro ao avaliar acusação: {str(e)}")
                                 st.session_state.resultado_acusacao = None
@@ -335,6 +576,7 @@ def mostrar_caso(caso):
                 if st.button("❌ Cancelar", key="cancelar_acusacao", use_container_width=True):
                     if "resultado_acusacao" in st.session_state:
                         del st.session_state.resultado_acusacao
+                    st.session_state.acusacao_correta = None
             
             # Verificação segura do resultado
             if "resultado_acusacao" in st.session_state:
@@ -346,10 +588,11 @@ def mostrar_caso(caso):
                 elif isinstance(resultado, str):
                     st.divider()
                     
-                    if "CORRETO" in resultado.upper():
+                    if st.session_state.get("acusacao_correta"):
                         st.success("🎉 Acusação Correta!")
-                        st.session_state.fim_jogo = True
-                        st.balloons()
+                        definir(fim_jogo=True)
+                        # A tela de fim de jogo fica fora das abas
+                        st.rerun()
                     else:
                         st.error("❌ Acusação Incorreta!")
                     
@@ -358,4 +601,42 @@ def mostrar_caso(caso):
                 else:
                     st.warning(f"Tipo inesperado de resultado: {type(resultado)}")
         st.markdown("</div>", unsafe_allow_html=True)
-        
\ No newline at end of file
+        salvar_sessao()
+
+@st.fragment(run_every=SALA_INTERVALO)
+def acompanhar_sala():
+    """Consulta a versão da sala de tempos em tempos; só refaz a página quando ela muda"""
+    st.caption(f"👥 Sala `{st.session_state.sala}` — quem abrir o app com ?sala={st.session_state.sala} joga este mesmo caso com você.")
+    if sincronizar_sala():
+        st.rerun()
+
+def mostrar_painel_desempenho(extras=None):
+    """Painel de administração: percentis por operação e estado das filas"""
+    with st.expander("📊 Desempenho (admin)", expanded=False):
+        linhas = []
+        for operacao, info in metrics.resumo().items():
+            latencia, ttft = info["latencia"], info["ttft"]
+            linhas.append({
+                "operação": operacao,
+                "chamadas": info["chamadas"],
+                "p50 (s)": latencia["p50"],
+                "p95 (s)": latencia["p95"],
+                "p99 (s)": latencia["p99"],
+                "TTFT p50 (s)": ttft["p50"],
+                "TTFT p95 (s)": ttft["p95"],
+                "erros": info["erros"],
+                "retries": info["retries"],
+                "hedges": info["hedges"],
+                "cache": info["cache_acertos"],
+                "tokens prompt": info["tokens_prompt"],
+                "tokens prompt (cache)": info["tokens_prompt_cache"],
+                "tokens resposta": info["tokens_completion"],
+            })
+        if linhas:
+            st.dataframe(linhas, hide_index=True, use_container_width=True)
+        else:
+            st.caption("Nenhuma operação registrada ainda.")
+        for titulo, dados in (extras or {}).items():
+            st.caption(titulo)
+            st.json(dados, expanded=False)
+        st.download_button("⬇️ Métricas (Prometheus)", metrics.exportar_prometheus(), file_name="metrics.prom", mime="text/plain")
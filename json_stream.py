@@ -0,0 +1,69 @@
+import json
+
+
+class LeitorJSONIncremental:
+    """Lê um objeto JSON em pedaços e entrega cada campo de primeiro nível assim que ele fecha"""
+
+    def __init__(self):
+        self.texto = ""
+        self._pos = 0
+        self._profundidade = 0
+        self._em_string = False
+        self._escape = False
+        self._inicio_chave = None
+        self._chave = None
+        self._inicio_valor = None
+        self.campos = {}
+
+    def alimentar(self, trecho):
+        """Acrescenta um pedaço do texto; devolve a lista de (chave, valor) concluídos nele"""
+        self.texto += trecho
+        concluidos = []
+        texto = self.texto
+        for pos in range(self._pos, len(texto)):
+            c = texto[pos]
+            if self._profundidade == 0:
+                # Ignora o que vier antes do objeto (ex.: cercas de markdown) e depois dele
+                if c == '{' and not self.campos:
+                    self._profundidade = 1
+                continue
+            if self._em_string:
+                if self._escape:
+                    self._escape = False
+                elif c == '\\':
+                    self._escape = True
+                elif c == '"':
+                    self._em_string = False
+                    if self._profundidade == 1 and self._inicio_chave is not None:
+                        self._chave = json.loads(texto[self._inicio_chave:pos + 1])
+                        self._inicio_chave = None
+                continue
+            if c == '"':
+                self._em_string = True
+                # Uma string no primeiro nível, antes dos dois-pontos, é uma chave
+                if self._profundidade == 1 and self._chave is None:
+                    self._inicio_chave = pos
+            elif c in '{[':
+                self._profundidade += 1
+            elif c in '}]':
+                if self._profundidade == 1:
+                    self._concluir(texto, pos, concluidos)
+                self._profundidade -= 1
+            elif c == ':' and self._profundidade == 1:
+                self._inicio_valor = pos + 1
+            elif c == ',' and self._profundidade == 1:
+                self._concluir(texto, pos, concluidos)
+        self._pos = len(texto)
+        return concluidos
+
+    def _concluir(self, texto, fim, concluidos):
+        if self._chave is not None and self._inicio_valor is not None:
+            try:
+                valor = json.loads(texto[self._inicio_valor:fim])
+            except json.JSONDecodeError:
+                valor = None
+            if valor is not None:
+                self.campos[self._chave] = valor
+                concluidos.append((self._chave, valor))
+        self._chave = None
+        self._inicio_valor = None
@@ -0,0 +1,445 @@
+import os
+import heapq
+import itertools
+import queue
+import random
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import metrics
+from model_router import RoteadorModelos
+
+load_dotenv()
+
+# Prioridades: quanto menor, mais cedo é atendida
+INTERATIVA = 0
+SEGUNDO_PLANO = 1
+
+# Tempo máximo de cada chamada, por prioridade (segundos)
+TIMEOUTS = {
+    INTERATIVA: float(os.getenv("LLM_TIMEOUT_INTERATIVO", "45")),
+    SEGUNDO_PLANO: float(os.getenv("LLM_TIMEOUT_SEGUNDO_PLANO", "120")),
+}
+MAX_TENTATIVAS = int(os.getenv("LLM_MAX_TENTATIVAS", "4"))
+
+# Modelos em uso, separados por vírgula; o roteador escolhe entre eles a cada chamada
+MODELOS = [m.strip() for m in os.getenv("LLM_MODELOS", "google/gemma-3-27b-it:free").split(",") if m.strip()]
+# Chamadas interativas ganham uma cópia em outro modelo se o primeiro trecho atrasar (0 desliga)
+HEDGE = os.getenv("LLM_HEDGE", "1") == "1"
+# Modelos (por prefixo) cujo cache de prompt precisa ser pedido com cache_control na mensagem
+# de sistema; os demais provedores da OpenRouter reaproveitam prefixos sozinhos
+CACHE_CONTROL = tuple(p.strip() for p in os.getenv("LLM_CACHE_CONTROL", "anthropic/,google/gemini").split(",") if p.strip())
+# Modelos (por prefixo) que reaproveitam prefixos de prompt, com ou sem cache_control
+CACHE_PREFIXO = tuple(
+    p.strip() for p in os.getenv("LLM_CACHE_PREFIXO", "anthropic/,google/gemini,openai/,deepseek/").split(",") if p.strip()
+)
+
+
+class BaldeTokens:
+    """Limitador de taxa: 'taxa' requisições por segundo, com rajadas de até 'capacidade'"""
+
+    def __init__(self, taxa, capacidade):
+        self.taxa = taxa
+        self.capacidade = capacidade
+        self._tokens = capacidade
+        self._ultimo = time.monotonic()
+
+    def _repor(self):
+        agora = time.monotonic()
+        self._tokens = min(self.capacidade, self._tokens + (agora - self._ultimo) * self.taxa)
+        self._ultimo = agora
+
+    def tentar_consumir(self):
+        """Consome um token e devolve 0, ou devolve quanto tempo falta para haver um"""
+        self._repor()
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0.0
+        return (1 - self._tokens) / self.taxa
+
+
+class Desistencia(Exception):
+    """A chamada deixou de ser necessária (ex.: o outro braço do hedge já respondeu)"""
+
+
+class Agendador:
+    """Limite global de chamadas simultâneas, atendidas por prioridade e pelo balde de tokens"""
+
+    def __init__(self, limite, balde, reserva_interativa=1):
+        self.limite = limite
+        self.balde = balde
+        # Vagas que o trabalho em segundo plano nunca ocupa
+        self.reserva_interativa = min(reserva_interativa, limite - 1)
+        self._cond = threading.Condition()
+        self._fila = []
+        self._sequencia = itertools.count()
+        self._em_uso = 0
+
+    def _vagas(self, prioridade):
+        limite = self.limite if prioridade == INTERATIVA else self.limite - self.reserva_interativa
+        return limite - self._em_uso
+
+    def adquirir(self, prioridade, desistir=None):
+        """Espera uma vaga; se o evento 'desistir' for setado antes, sai com Desistencia"""
+        with self._cond:
+            entrada = (prioridade, next(self._sequencia))
+            heapq.heappush(self._fila, entrada)
+            try:
+                while True:
+                    if desistir is not None and desistir.is_set():
+                        raise Desistencia()
+                    if self._fila[0] == entrada and self._vagas(prioridade) > 0:
+                        espera = self.balde.tentar_consumir()
+                        if espera == 0:
+                            break
+                        self._cond.wait(espera)
+                    else:
+                        self._cond.wait()
+            except BaseException:
+                self._fila.remove(entrada)
+                heapq.heapify(self._fila)
+                self._cond.notify_all()
+                raise
+            heapq.heappop(self._fila)
+            self._em_uso += 1
+            self._cond.notify_all()
+
+    def liberar(self):
+        with self._cond:
+            self._em_uso -= 1
+            self._cond.notify_all()
+
+    def acordar(self):
+        """Faz quem está esperando conferir de novo o evento de desistência"""
+        with self._cond:
+            self._cond.notify_all()
+
+    def estatisticas(self):
+        with self._cond:
+            return {"em_uso": self._em_uso, "aguardando": len(self._fila), "limite": self.limite}
+
+
+agendador = Agendador(
+    limite=int(os.getenv("LLM_CONCORRENCIA", "4")),
+    balde=BaldeTokens(
+        taxa=float(os.getenv("LLM_REQ_POR_MINUTO", "20")) / 60,
+        capacidade=int(os.getenv("LLM_RAJADA", "5")),
+    ),
+)
+
+roteador = RoteadorModelos(
+    MODELOS,
+    quarentena=float(os.getenv("LLM_QUARENTENA", "30")),
+    atraso_padrao=float(os.getenv("LLM_HEDGE_ATRASO", "2")),
+)
+
+_cliente = None
+_cliente_lock = threading.Lock()
+# Passa a False na primeira vez que o provedor recusar response_format
+_json_mode_suportado = True
+
+
+def obter_cliente():
+    """Cliente OpenRouter único do processo, com pool de conexões HTTP ajustado
+
+    O SDK e o httpx só são importados aqui, na primeira chamada ao LLM: a tela inicial
+    de um processo novo não paga por eles.
+    """
+    global _cliente
+    if _cliente is None:
+        with _cliente_lock:
+            if _cliente is None:
+                import httpx
+                from openai import OpenAI
+
+                http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=int(os.getenv("LLM_CONEXOES_MAX", "20")),
+                        max_keepalive_connections=int(os.getenv("LLM_CONEXOES_OCIOSAS", "10")),
+                        keepalive_expiry=60,
+                    ),
+                    timeout=httpx.Timeout(60, connect=5),
+                )
+                _cliente = OpenAI(
+                    base_url=os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1"),
+                    api_key=os.getenv("OPENROUTER_API_KEY"),
+                    default_headers={
+                        "HTTP-Referer": "https://github.com/Mogutaa/detetives-da-vez",
+                        "X-Title": "Detetives da Vez"
+                    },
+                    http_client=http_client,
+                    # As novas tentativas são feitas aqui, com jitter, e não dentro do SDK
+                    max_retries=0,
+                )
+    return _cliente
+
+
+def _deve_tentar_de_novo(erro):
+    import openai
+
+    if isinstance(erro, (openai.RateLimitError, openai.APIConnectionError)):
+        return True
+    return isinstance(erro, openai.APIStatusError) and erro.status_code >= 500
+
+
+def _espera(estado):
+    """Backoff exponencial com jitter total, respeitando o Retry-After quando houver"""
+    base = random.uniform(0, min(30.0, 0.5 * 2 ** estado.attempt_number))
+    erro = estado.outcome.exception() if estado.outcome else None
+    resposta = getattr(erro, "response", None)
+    if resposta is not None:
+        try:
+            return max(base, float(resposta.headers.get("retry-after", 0)))
+        except ValueError:
+            pass
+    return base
+
+
+def _tentativas(desistir=None):
+    from tenacity import Retrying, retry_if_exception, stop_after_attempt
+
+    opcoes = {}
+    if desistir is not None:
+        # O backoff termina assim que o evento for setado; a tentativa seguinte desiste
+        opcoes["sleep"] = desistir.wait
+    return Retrying(
+        retry=retry_if_exception(_deve_tentar_de_novo),
+        wait=_espera,
+        stop=stop_after_attempt(MAX_TENTATIVAS),
+        reraise=True,
+        **opcoes
+    )
+
+
+def cache_de_prefixo():
+    """Se qualquer modelo que o roteador possa escolher reaproveita prefixos de prompt"""
+    return all(m.startswith(CACHE_PREFIXO) for m in roteador.modelos)
+
+
+def _marcar_prefixo(model, messages):
+    """Marca a mensagem de sistema como prefixo cacheável nos modelos que exigem cache_control"""
+    if not model.startswith(CACHE_CONTROL) or not messages or messages[0]["role"] != "system":
+        return messages
+    sistema = {
+        "role": "system",
+        "content": [{"type": "text", "text": messages[0]["content"], "cache_control": {"type": "ephemeral"}}],
+    }
+    return [sistema] + messages[1:]
+
+
+def _criar(model, messages, prioridade, json_mode, **params):
+    """Cria a completion pedindo saída JSON quando o provedor aceitar"""
+    global _json_mode_suportado
+    import openai
+
+    messages = _marcar_prefixo(model, messages)
+
+    if json_mode and _json_mode_suportado:
+        try:
+            return obter_cliente().chat.completions.create(
+                model=model,
+                messages=messages,
+                timeout=TIMEOUTS[prioridade],
+                response_format={"type": "json_object"},
+                **params
+            )
+        except openai.BadRequestError as e:
+            if "response_format" not in str(e):
+                raise
+            _json_mode_suportado = False
+    return obter_cliente().chat.completions.create(
+        model=model,
+        messages=messages,
+        timeout=TIMEOUTS[prioridade],
+        **params
+    )
+
+
+def _tokens_em_cache(usage):
+    detalhes = getattr(usage, "prompt_tokens_details", None)
+    return getattr(detalhes, "cached_tokens", None) or 0
+
+
+def _registrar_uso(uso, usage):
+    if uso is not None and usage is not None:
+        uso["prompt_tokens"] = uso.get("prompt_tokens", 0) + (usage.prompt_tokens or 0)
+        uso["completion_tokens"] = uso.get("completion_tokens", 0) + (usage.completion_tokens or 0)
+        uso["cached_tokens"] = uso.get("cached_tokens", 0) + _tokens_em_cache(usage)
+
+
+def completar(messages, model=None, prioridade=INTERATIVA, json_mode=False, uso=None, operacao="llm", **params):
+    """Chamada sem streaming; devolve a resposta completa do SDK
+
+    Sem 'model', usa o modelo que o roteador indicar.
+    """
+    modelo = model or roteador.escolher()
+    inicio = time.perf_counter()
+    tentativas = 0
+    try:
+        for tentativa in _tentativas():
+            with tentativa:
+                tentativas = tentativa.retry_state.attempt_number
+                agendador.adquirir(prioridade)
+                # O roteador compara provedores: a espera na nossa fila e o backoff ficam de fora
+                enviado = time.perf_counter()
+                try:
+                    resposta = _criar(modelo, messages, prioridade, json_mode, **params)
+                finally:
+                    agendador.liberar()
+    except Exception as e:
+        roteador.registrar(modelo, erro=True)
+        metrics.registrar(operacao, time.perf_counter() - inicio, retries=tentativas - 1, erro=e)
+        raise
+    roteador.registrar(modelo, time.perf_counter() - enviado)
+    usage = getattr(resposta, "usage", None)
+    _registrar_uso(uso, usage)
+    metrics.registrar(
+        operacao,
+        time.perf_counter() - inicio,
+        tokens_prompt=getattr(usage, "prompt_tokens", None),
+        tokens_completion=getattr(usage, "completion_tokens", None),
+        retries=tentativas - 1,
+        tokens_prompt_cache=_tokens_em_cache(usage)
+    )
+    return resposta
+
+
+def _fechar(stream):
+    close = getattr(stream, "close", None)
+    if close:
+        close()
+    agendador.liberar()
+
+
+def _abrir_stream(modelo, messages, prioridade, json_mode, operacao, params, desistir=None, ao_adquirir=None):
+    """Abre o stream e lê o primeiro trecho; devolve (stream, iterador, primeiro chunk)
+
+    Quem recebe o stream passa a ser dono da vaga no agendador e deve chamar _fechar.
+    Se 'desistir' for setado antes do envio (na fila ou no backoff), sai com Desistencia
+    sem fazer a chamada; 'ao_adquirir' é chamado quando a primeira vaga é obtida.
+    """
+    try:
+        for tentativa in _tentativas(desistir):
+            with tentativa:
+                if tentativa.retry_state.attempt_number > 1:
+                    metrics.contar(operacao, "retries")
+                agendador.adquirir(prioridade, desistir)
+                if ao_adquirir is not None:
+                    ao_adquirir()
+                    ao_adquirir = None
+                # Conferido depois de 'ao_adquirir', que pode decidir a desistência
+                if desistir is not None and desistir.is_set():
+                    agendador.liberar()
+                    raise Desistencia()
+                # A latência do modelo conta a partir do envio, sem a nossa fila nem o backoff
+                inicio = time.perf_counter()
+                try:
+                    stream = _criar(modelo, messages, prioridade, json_mode, stream=True, **params)
+                except BaseException:
+                    agendador.liberar()
+                    raise
+        try:
+            iterador = iter(stream)
+            primeiro = next(iterador, None)
+        except BaseException:
+            _fechar(stream)
+            raise
+    except Desistencia:
+        raise
+    except Exception:
+        roteador.registrar(modelo, erro=True)
+        raise
+    roteador.registrar(modelo, time.perf_counter() - inicio)
+    return stream, iterador, primeiro
+
+
+def _abrir_com_hedge(modelo, messages, prioridade, json_mode, operacao, params):
+    """Abre o stream em 'modelo'; se o primeiro trecho passar do p95 dele (ou a chamada
+    falhar), dispara uma cópia no próximo modelo. Fica com o que responder primeiro e fecha o outro.
+
+    O prazo do hedge só corre depois que a chamada original ganha uma vaga no agendador:
+    esperar na nossa própria fila não é lentidão do provedor, e uma cópia ali só dobraria a
+    carga. O braço que perde desiste antes de enviar, se ainda estiver na fila ou no backoff.
+    """
+    prontos = queue.Queue()
+    decidido = threading.Event()
+    trava = threading.Lock()
+
+    def braco(m, ao_adquirir=None):
+        try:
+            aberto = _abrir_stream(m, messages, prioridade, json_mode, operacao, params, decidido, ao_adquirir)
+        except Desistencia:
+            return
+        except Exception as e:
+            prontos.put((None, None, e))
+            return
+        with trava:
+            perdeu = decidido.is_set()
+            decidido.set()
+        if perdeu:
+            _fechar(aberto[0])
+        else:
+            # O outro braço pode estar esperando vaga: acorda-o para que desista
+            agendador.acordar()
+            prontos.put((None, aberto, None))
+
+    def disparar(m, ao_adquirir=None):
+        threading.Thread(target=braco, args=(m, ao_adquirir), name="llm-hedge", daemon=True).start()
+
+    disparar(modelo, lambda: prontos.put((time.monotonic(), None, None)))
+    pendentes = 1
+    reserva = None
+    prazo = None
+    while True:
+        if reserva is not None or prazo is None:
+            espera = None
+        else:
+            espera = max(0.0, prazo - time.monotonic())
+        try:
+            vaga, aberto, erro = prontos.get(timeout=espera)
+        except queue.Empty:
+            vaga, aberto, erro = None, None, None
+        if vaga is not None:
+            prazo = vaga + roteador.atraso_hedge(modelo)
+            continue
+        if aberto is not None:
+            return aberto
+        if erro is not None:
+            pendentes -= 1
+        if reserva is None:
+            # O primeiro atrasou ou falhou: a cópia vai para o melhor dos outros modelos
+            reserva = roteador.escolher(excluir={modelo})
+            if reserva is not None:
+                metrics.contar(operacao, "hedges")
+                disparar(reserva)
+                pendentes += 1
+        if erro is not None and pendentes == 0:
+            raise erro
+
+
+def completar_stream(messages, model=None, prioridade=INTERATIVA, json_mode=False, uso=None, operacao="llm",
+                     desistir=None, ao_adquirir=None, **params):
+    """Gera os trechos de texto da resposta; só repete a chamada enquanto ela não começou
+
+    Sem 'model', o roteador escolhe o modelo e, nas chamadas interativas, uma cópia em
+    outro modelo protege contra um provedor lento. Se 'uso' for um dict, ele recebe a
+    contagem de tokens informada pelo provedor. 'desistir' e 'ao_adquirir' valem para as
+    chamadas sem hedge, como em _abrir_stream.
+    """
+    if uso is not None:
+        params["stream_options"] = {"include_usage": True}
+    if model is None and prioridade == INTERATIVA and HEDGE and len(roteador.modelos) > 1:
+        stream, iterador, primeiro = _abrir_com_hedge(roteador.escolher(), messages, prioridade, json_mode, operacao, params)
+    else:
+        stream, iterador, primeiro = _abrir_stream(
+            model or roteador.escolher(), messages, prioridade, json_mode, operacao, params, desistir, ao_adquirir
+        )
+    try:
+        for chunk in itertools.chain([primeiro] if primeiro is not None else [], iterador):
+            _registrar_uso(uso, getattr(chunk, "usage", None))
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield chunk.choices[0].delta.content
+    finally:
+        _fechar(stream)
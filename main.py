@@ -1,33 +1,103 @@
 import streamlit as st
-from state_manager import reset_game_state
-from game_logic import gerar_caso
-from interface import mostrar_tela_inicial, mostrar_caso
+from state_manager import reset_game_state, novo_jogo, retomar_sessao, salvar_sessao, entrar_sala, criar_sala, sincronizar_sala, obter_salas, obter_biblioteca
+from game_logic import gerar_caso, gerar_caso_stream, montar_caso_do_stream, aplicar_jogadores, metricas_geracao, metricas_antecipacao, cache_interrogatorios, SEGUNDO_PLANO, MAX_GERACOES
+from interface import mostrar_tela_inicial, mostrar_caso, mostrar_caso_em_geracao, mostrar_painel_desempenho, acompanhar_sala
+from case_pool import PoolCasos
+from metrics import medir
+import llm_gateway
+import hmac
+import os
 import time
 
+@st.cache_resource
+def obter_pool():
+    """Pool de casos compartilhado por todas as sessões do processo"""
+    pool = PoolCasos(lambda modo: gerar_caso(modo, [], SEGUNDO_PLANO))
+    pool.iniciar()
+    return pool
+
 # Inicialização
 if 'caso' not in st.session_state:
     reset_game_state()
+    # Um link com ?sala=... entra no caso do grupo; um com ?sessao=... retoma o jogo salvo.
+    # Em nenhum dos dois o caso é gerado de novo
+    entrar_sala() or retomar_sessao()
 
 # Fluxo principal
 if st.session_state.caso is None:
     if st.session_state.get('modo_jogo') is not None:
+        caso_pronto = obter_pool().retirar(st.session_state.modo_jogo)
+        if caso_pronto is not None:
+            st.session_state.caso = aplicar_jogadores(caso_pronto, st.session_state.jogadores)
+            st.session_state.fim_jogo = False
+            salvar_sessao()
+            st.rerun()
         try:
             with st.spinner("🧠 Criando um mistério único..."):
-                st.session_state.caso = gerar_caso(
-                    st.session_state.modo_jogo,
-                    st.session_state.jogadores
-                )
+                area = st.empty()
+                for tentativa in range(MAX_GERACOES):
+                    stream = gerar_caso_stream(
+                        st.session_state.modo_jogo,
+                        st.session_state.jogadores
+                    )
+                    # Introdução e abas aparecem conforme cada seção do JSON fica completa;
+                    # uma nova tentativa desenha por cima da anterior
+                    with area.container():
+                        mostrar_caso_em_geracao(stream)
+                    try:
+                        st.session_state.caso = montar_caso_do_stream(stream, st.session_state.modo_jogo)
+                        break
+                    except ValueError:
+                        # Resposta irrecuperável: gera o caso inteiro de novo, como gerar_caso faz
+                        if tentativa == MAX_GERACOES - 1:
+                            raise
                 st.session_state.fim_jogo = False
+            salvar_sessao()
             st.rerun()
         except Exception as e:
             st.error(f"🔍 Erro ao gerar caso: {str(e)}")
             st.button("🔄 Tentar novamente", on_click=lambda: st.session_state.update(caso=None))
     else:
         mostrar_tela_inicial()
+        estoque = obter_pool().estatisticas()["modos"]
+        st.caption("⚡ Casos prontos: " + " · ".join(f"{modo} {info['profundidade']}" for modo, info in estoque.items()))
+        geracao = metricas_geracao()
+        if geracao["tokens_por_caso_valido"]:
+            st.caption(f"🧾 Regeneração: {geracao['taxa_regeneracao']:.0%} · ~{geracao['tokens_por_caso_valido']:.0f} tokens por caso válido")
 else:
+    # O que o grupo fez desde a última execução entra antes de desenhar qualquer coisa
+    sincronizar_sala()
     if st.session_state.fim_jogo:
         st.success("🎉 Caso resolvido com sucesso!")
+        st.balloons()
         st.write(st.session_state.resultado_acusacao)
-        st.button("🔄 Novo Jogo", on_click=reset_game_state)
+        st.button("🔄 Novo Jogo", on_click=novo_jogo)
     else:
-        mostrar_caso(st.session_state.caso)
\ No newline at end of file
+        with medir("render_caso"):
+            mostrar_caso(st.session_state.caso)
+        st.caption(f"🔗 Sessão `{st.session_state.sessao_id}` — abra o app com ?sessao={st.session_state.sessao_id} para continuar de onde parou.")
+        if st.session_state.sala:
+            acompanhar_sala()
+        else:
+            st.button("👥 Jogar em grupo", on_click=criar_sala, help="Cria uma sala: todos que entrarem pelo link jogam este mesmo caso")
+
+    # Gravação em lote numa thread do armazém; aqui só se agenda a cópia do progresso
+    salvar_sessao()
+
+# Painel de desempenho: ADMIN_PAINEL=1 no ambiente, ou ?admin=<ADMIN_SENHA> na URL quando há
+# uma senha configurada. Um parâmetro fixo qualquer abriria o painel para qualquer jogador
+ADMIN_SENHA = os.getenv("ADMIN_SENHA", "")
+if os.getenv("ADMIN_PAINEL") == "1" or (
+    ADMIN_SENHA and hmac.compare_digest(st.query_params.get("admin", "").encode(), ADMIN_SENHA.encode())
+):
+    biblioteca = obter_biblioteca()
+    mostrar_painel_desempenho({
+        "Pool de casos": obter_pool().estatisticas(),
+        "Biblioteca de casos": biblioteca.estatisticas() if biblioteca is not None else {"casos": 0},
+        "Geração de casos": metricas_geracao(),
+        "Fila de chamadas ao LLM": llm_gateway.agendador.estatisticas(),
+        "Modelos": llm_gateway.roteador.estatisticas(),
+        "Cache de interrogatórios": cache_interrogatorios.estatisticas(),
+        "Respostas antecipadas": metricas_antecipacao(),
+        "Salas": obter_salas().estatisticas(),
+    })
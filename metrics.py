@@ -0,0 +1,159 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+# Amostras guardadas por operação para o cálculo dos percentis
+AMOSTRAS = int(os.getenv("METRICAS_AMOSTRAS", "1000"))
+# Arquivo JSON-lines com um evento por chamada (desligado se vazio)
+ARQUIVO_LOG = os.getenv("METRICAS_LOG", "")
+# Arquivo no formato texto do Prometheus, regravado periodicamente (desligado se vazio)
+ARQUIVO_PROMETHEUS = os.getenv("METRICAS_PROM", "")
+INTERVALO_EXPORTACAO = float(os.getenv("METRICAS_INTERVALO", "15"))
+
+CONTADORES = (
+    "chamadas", "erros", "retries", "hedges", "cache_acertos", "tokens_prompt", "tokens_prompt_cache", "tokens_completion"
+)
+
+
+class _Operacao:
+    __slots__ = ("latencias", "ttfts") + CONTADORES
+
+    def __init__(self):
+        self.latencias = deque(maxlen=AMOSTRAS)
+        self.ttfts = deque(maxlen=AMOSTRAS)
+        for contador in CONTADORES:
+            setattr(self, contador, 0)
+
+
+_operacoes = {}
+_lock = threading.Lock()
+_arquivo = None
+_exportador = None
+
+
+def _operacao(nome):
+    operacao = _operacoes.get(nome)
+    if operacao is None:
+        operacao = _operacoes.setdefault(nome, _Operacao())
+    return operacao
+
+
+def _iniciar_exportador():
+    global _arquivo, _exportador
+    if ARQUIVO_LOG and _arquivo is None:
+        _arquivo = open(ARQUIVO_LOG, "a", encoding="utf-8")
+    if (ARQUIVO_LOG or ARQUIVO_PROMETHEUS) and _exportador is None:
+        _exportador = threading.Thread(target=_exportar_periodicamente, name="metricas", daemon=True)
+        _exportador.start()
+
+
+def registrar(operacao, latencia, ttft=None, tokens_prompt=None, tokens_completion=None,
+              retries=0, cache=False, erro=None, tokens_prompt_cache=None):
+    """Registra uma chamada; barato o bastante para o caminho quente"""
+    with _lock:
+        dados = _operacao(operacao)
+        dados.chamadas += 1
+        dados.latencias.append(latencia)
+        if ttft is not None:
+            dados.ttfts.append(ttft)
+        dados.tokens_prompt += tokens_prompt or 0
+        # Parte do prompt que o provedor leu do cache de prefixos
+        dados.tokens_prompt_cache += tokens_prompt_cache or 0
+        dados.tokens_completion += tokens_completion or 0
+        dados.retries += retries
+        dados.cache_acertos += 1 if cache else 0
+        dados.erros += 1 if erro else 0
+        if ARQUIVO_LOG:
+            _iniciar_exportador()
+            # O arquivo é bufferizado; a thread de exportação faz o flush
+            _arquivo.write(json.dumps({
+                "ts": round(time.time(), 3),
+                "operacao": operacao,
+                "latencia": round(latencia, 4),
+                "ttft": None if ttft is None else round(ttft, 4),
+                "tokens_prompt": tokens_prompt,
+                "tokens_prompt_cache": tokens_prompt_cache,
+                "tokens_completion": tokens_completion,
+                "retries": retries,
+                "cache": cache,
+                "erro": None if erro is None else type(erro).__name__,
+            }) + "\n")
+        elif ARQUIVO_PROMETHEUS and _exportador is None:
+            _iniciar_exportador()
+
+
+def contar(operacao, contador, quantidade=1):
+    with _lock:
+        dados = _operacao(operacao)
+        setattr(dados, contador, getattr(dados, contador) + quantidade)
+
+
+@contextmanager
+def medir(operacao):
+    """Mede o bloco (ex.: renderização de uma aba) e registra a duração em 'operacao'"""
+    inicio = time.perf_counter()
+    erro = None
+    try:
+        yield
+    except Exception as e:
+        erro = e
+        raise
+    finally:
+        registrar(operacao, time.perf_counter() - inicio, erro=erro)
+
+
+def _percentis(valores):
+    if not valores:
+        return {"p50": None, "p95": None, "p99": None}
+    ordenados = sorted(valores)
+    ultimo = len(ordenados) - 1
+    return {f"p{q}": ordenados[min(ultimo, int(round(q / 100 * ultimo)))] for q in (50, 95, 99)}
+
+
+def resumo():
+    """Percentis de latência e de TTFT e contadores por operação"""
+    with _lock:
+        copia = {nome: (list(d.latencias), list(d.ttfts), {c: getattr(d, c) for c in CONTADORES})
+                 for nome, d in _operacoes.items()}
+    return {
+        nome: {"latencia": _percentis(latencias), "ttft": _percentis(ttfts), **contadores}
+        for nome, (latencias, ttfts, contadores) in sorted(copia.items())
+    }
+
+
+def exportar_prometheus():
+    """Métricas no formato texto de exposição do Prometheus"""
+    linhas = []
+    dados = resumo()
+    # Cada família de métricas fica contígua, como o formato exige
+    for metrica, serie in (("detetives_latencia_segundos", "latencia"), ("detetives_ttft_segundos", "ttft")):
+        linhas.append(f"# TYPE {metrica} summary")
+        for nome, info in dados.items():
+            for quantil, chave in ((0.5, "p50"), (0.95, "p95"), (0.99, "p99")):
+                if info[serie][chave] is not None:
+                    linhas.append(f'{metrica}{{operacao="{nome}",quantile="{quantil}"}} {info[serie][chave]:.6f}')
+    for contador in CONTADORES:
+        linhas.append(f"# TYPE detetives_{contador}_total counter")
+        for nome, info in dados.items():
+            linhas.append(f'detetives_{contador}_total{{operacao="{nome}"}} {info[contador]}')
+    return "\n".join(linhas) + "\n"
+
+
+def _exportar_periodicamente():
+    while True:
+        time.sleep(INTERVALO_EXPORTACAO)
+        try:
+            if _arquivo is not None:
+                with _lock:
+                    _arquivo.flush()
+            if ARQUIVO_PROMETHEUS:
+                temporario = ARQUIVO_PROMETHEUS + ".tmp"
+                with open(temporario, "w", encoding="utf-8") as f:
+                    f.write(exportar_prometheus())
+                # Troca atômica: quem coleta nunca lê um arquivo pela metade
+                os.replace(temporario, ARQUIVO_PROMETHEUS)
+        except OSError:
+            pass
@@ -0,0 +1,82 @@
+import threading
+import time
+from collections import deque
+
+# Amostras mínimas de um modelo antes de confiar no p95 dele para o hedge
+MIN_AMOSTRAS = 5
+
+
+class RoteadorModelos:
+    """Escolhe, entre os modelos configurados, o mais rápido dos que estão saudáveis
+
+    Cada modelo guarda uma janela com os resultados recentes: a latência até o primeiro
+    trecho, ou None quando a chamada falhou. Um modelo é saudável enquanto a taxa de erros
+    da janela fica abaixo de 'limite_erros'; depois de 'quarentena' segundos sem falhar ele
+    volta a ser tentado.
+    """
+
+    def __init__(self, modelos, janela=50, limite_erros=0.5, quarentena=30.0, atraso_padrao=2.0):
+        self.modelos = list(modelos)
+        self.limite_erros = limite_erros
+        self.quarentena = quarentena
+        self.atraso_padrao = atraso_padrao
+        self._janelas = {m: deque(maxlen=janela) for m in self.modelos}
+        self._ultima_falha = {m: 0.0 for m in self.modelos}
+        self._lock = threading.Lock()
+
+    def registrar(self, modelo, latencia=None, erro=False):
+        with self._lock:
+            janela = self._janelas.get(modelo)
+            if janela is None:
+                return
+            janela.append(None if erro else latencia)
+            if erro:
+                self._ultima_falha[modelo] = time.monotonic()
+
+    def _taxa_erros(self, modelo):
+        janela = self._janelas[modelo]
+        return sum(1 for l in janela if l is None) / len(janela) if janela else 0.0
+
+    def _saudavel(self, modelo):
+        return (self._taxa_erros(modelo) < self.limite_erros
+                or time.monotonic() - self._ultima_falha[modelo] > self.quarentena)
+
+    def _latencias(self, modelo):
+        return sorted(l for l in self._janelas[modelo] if l is not None)
+
+    def _mediana(self, modelo):
+        latencias = self._latencias(modelo)
+        # Modelo ainda sem medidas vem primeiro, para ganhar amostras
+        return latencias[len(latencias) // 2] if latencias else 0.0
+
+    def escolher(self, excluir=()):
+        """Modelo mais rápido (mediana) entre os saudáveis; None se não sobrar nenhum"""
+        with self._lock:
+            candidatos = [m for m in self.modelos if m not in excluir]
+            if not candidatos:
+                return None
+            saudaveis = [m for m in candidatos if self._saudavel(m)]
+            if saudaveis:
+                return min(saudaveis, key=self._mediana)
+            # Todos degradados: fica com o que menos falhou
+            return min(candidatos, key=self._taxa_erros)
+
+    def atraso_hedge(self, modelo):
+        """Quanto esperar pelo primeiro trecho de 'modelo' antes de disparar uma cópia: o p95 dele"""
+        with self._lock:
+            latencias = self._latencias(modelo) if modelo in self._janelas else []
+        if len(latencias) < MIN_AMOSTRAS:
+            return self.atraso_padrao
+        return latencias[min(len(latencias) - 1, int(round(0.95 * (len(latencias) - 1))))]
+
+    def estatisticas(self):
+        with self._lock:
+            return {
+                m: {
+                    "amostras": len(self._janelas[m]),
+                    "mediana": self._mediana(m) if self._latencias(m) else None,
+                    "taxa_erros": round(self._taxa_erros(m), 3),
+                    "saudavel": self._saudavel(m),
+                }
+                for m in self.modelos
+            }
@@ -0,0 +1,107 @@
+import os
+
+import llm_gateway
+from cache import CacheLRU
+from conversation_memory import estimar_tokens
+
+# Casos com prompts já compilados em memória (um por caso em jogo basta)
+PROMPTS_CASOS = int(os.getenv("PROMPTS_CASOS", "256"))
+
+INSTRUCOES_INTERROGATORIO = (
+    "Você interpreta um suspeito num jogo de detetive. Responda às perguntas do detetive "
+    "de forma breve e natural, sem sair do personagem e sem contradizer o que já disse."
+)
+INSTRUCOES_RESUMO = """Resuma o caso para os detetives. Se houver um resumo anterior, atualize-o em vez de começar do zero.
+Destaque:
+- Contradições importantes
+- Pontos-chave ainda não resolvidos
+- Possíveis teorias (sem revelar o culpado)
+- Sugestões de próximos passos
+Use no máximo 250 palavras."""
+INSTRUCOES_DESFECHO = (
+    "Narre em até 2 parágrafos o desfecho de uma acusação neste jogo de detetive. "
+    "Se a acusação for incorreta, não revele quem é o culpado."
+)
+
+
+class Prompt:
+    """Prompt com prefixo fixo: a mensagem de sistema não muda entre chamadas e os tokens
+    dela são medidos uma vez; a cada chamada só o sufixo (a mensagem do usuário) é novo.
+
+    Manter o prefixo idêntico, byte a byte, é o que deixa o provedor reaproveitar o cache.
+    """
+
+    __slots__ = ("sistema", "tokens_sistema")
+
+    def __init__(self, sistema):
+        self.sistema = sistema
+        self.tokens_sistema = estimar_tokens(sistema)
+
+    def mensagens(self, sufixo):
+        return [{"role": "system", "content": self.sistema}, {"role": "user", "content": sufixo}]
+
+    def tokens(self, sufixo):
+        return self.tokens_sistema + estimar_tokens(sufixo)
+
+
+def _fatos(caso):
+    # Só o que os detetives também sabem: nada de culpado, motivações ou pistas
+    linhas = [f"Caso: {caso.titulo}", caso.introducao, "Suspeitos:"]
+    linhas.extend(f"- {p.nome}: {p.descricao}" for p in caso.personagens)
+    linhas.append("Locais: " + ", ".join(l.nome for l in caso.locais))
+    return "\n".join(linhas)
+
+
+class PromptsCaso:
+    """Prompts de um caso, montados uma única vez
+
+    Com cache de prefixo, os fatos do caso vêm antes da ficha do suspeito e os interrogatórios
+    de todos os suspeitos compartilham o mesmo começo, que o provedor cobra uma vez só. Sem
+    ele, esses fatos seriam pagos a cada pergunta: o interrogatório leva só a ficha, o desfecho
+    só o título e o resumo o título e os nomes dos suspeitos.
+    """
+
+    def __init__(self, caso, cache_de_prefixo=None):
+        if cache_de_prefixo is None:
+            cache_de_prefixo = llm_gateway.cache_de_prefixo()
+        self._caso = caso
+        if cache_de_prefixo:
+            self._fatos = _fatos(caso)
+            resumo = desfecho = self._fatos
+        else:
+            self._fatos = None
+            desfecho = f"Caso: {caso.titulo}"
+            resumo = desfecho + "\nSuspeitos: " + ", ".join(p.nome for p in caso.personagens)
+        self.resumo = Prompt(f"{INSTRUCOES_RESUMO}\n\n{resumo}")
+        self.desfecho = Prompt(f"{INSTRUCOES_DESFECHO}\n\n{desfecho}")
+        self._interrogatorios = {}
+
+    def interrogatorio(self, nome):
+        """Prompt do suspeito 'nome', ou None se ele não estiver no caso"""
+        prompt = self._interrogatorios.get(nome)
+        if prompt is None:
+            personagem = self._caso.personagem(nome)
+            if personagem is None:
+                return None
+            ficha = (
+                f"Você é {personagem.nome} ({personagem.descricao}).\n"
+                f"Motivação oculta: {personagem.motivacao}\n"
+                + ("Você é o culpado!" if personagem.culpado else "Você é inocente.")
+            )
+            fatos = f"{self._fatos}\n\n" if self._fatos else ""
+            prompt = self._interrogatorios.setdefault(
+                nome, Prompt(f"{INSTRUCOES_INTERROGATORIO}\n\n{fatos}{ficha}")
+            )
+        return prompt
+
+
+_compilados = CacheLRU(PROMPTS_CASOS)
+
+
+def prompts_do_caso(caso):
+    """PromptsCaso do caso, compilado na primeira chamada e reaproveitado pelas sessões"""
+    prompts = _compilados.obter(caso.id)
+    if prompts is None:
+        prompts = PromptsCaso(caso)
+        _compilados.guardar(caso.id, prompts)
+    return prompts
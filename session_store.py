@@ -0,0 +1,110 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+from case_model import Caso
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS casos (
+    id TEXT PRIMARY KEY,
+    modo TEXT,
+    dados TEXT NOT NULL,
+    criado_em REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessoes (
+    id TEXT PRIMARY KEY,
+    caso_id TEXT NOT NULL REFERENCES casos(id),
+    progresso TEXT NOT NULL,
+    atualizado_em REAL NOT NULL
+);
+"""
+
+
+class ArmazemSessoes:
+    """Casos gerados e progresso das sessões em SQLite, gravados em lote por uma thread própria"""
+
+    def __init__(self, caminho=None, intervalo=0.5):
+        self.caminho = caminho or os.getenv("DETETIVES_DB", "detetives.db")
+        self.intervalo = intervalo
+        self._fila = queue.Queue()
+        self._leitura = self._conectar()
+        self._leitura_lock = threading.Lock()
+        self._leitura.executescript(ESQUEMA)
+        self.lotes_gravados = 0
+        self._thread = threading.Thread(target=self._gravar, name="armazem-sessoes", daemon=True)
+        self._thread.start()
+
+    def _conectar(self):
+        conexao = sqlite3.connect(self.caminho, check_same_thread=False, isolation_level=None)
+        # WAL deixa as leituras das sessões correrem em paralelo à thread de gravação
+        conexao.execute("PRAGMA journal_mode=WAL")
+        conexao.execute("PRAGMA synchronous=NORMAL")
+        return conexao
+
+    def salvar_caso(self, caso, modo=None):
+        self._fila.put(("caso", caso.id, (caso, modo)))
+
+    def salvar_progresso(self, sessao_id, caso_id, progresso):
+        """Agenda a gravação; 'progresso' deve ser uma cópia que a sessão não vai mais alterar"""
+        self._fila.put(("sessao", sessao_id, (caso_id, progresso)))
+
+    def carregar_sessao(self, sessao_id):
+        """Devolve (caso, progresso) de uma sessão salva, ou None"""
+        with self._leitura_lock:
+            linha = self._leitura.execute(
+                "SELECT c.dados, s.progresso FROM sessoes s JOIN casos c ON c.id = s.caso_id WHERE s.id = ?",
+                (sessao_id,)
+            ).fetchone()
+        if linha is None:
+            return None
+        return Caso.de_json(linha[0]), json.loads(linha[1])
+
+    def carregar_caso(self, caso_id):
+        with self._leitura_lock:
+            linha = self._leitura.execute("SELECT dados FROM casos WHERE id = ?", (caso_id,)).fetchone()
+        return Caso.de_json(linha[0]) if linha else None
+
+    def _gravar(self):
+        conexao = self._conectar()
+        while True:
+            itens = [self._fila.get()]
+            # Junta o que chegar na janela; só a versão mais recente de cada sessão é gravada
+            limite = time.monotonic() + self.intervalo
+            while True:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    break
+                try:
+                    itens.append(self._fila.get(timeout=restante))
+                except queue.Empty:
+                    break
+            pendentes = {}
+            for tipo, chave, valor in itens:
+                pendentes[(tipo, chave)] = valor
+            try:
+                self._gravar_lote(conexao, pendentes)
+            finally:
+                for _ in itens:
+                    self._fila.task_done()
+
+    def _gravar_lote(self, conexao, pendentes):
+        agora = time.time()
+        casos = [(chave, modo, caso.para_json(), agora)
+                 for (tipo, chave), (caso, modo) in pendentes.items() if tipo == "caso"]
+        sessoes = [(chave, caso_id, json.dumps(progresso, ensure_ascii=False, separators=(",", ":")), agora)
+                   for (tipo, chave), (caso_id, progresso) in pendentes.items() if tipo == "sessao"]
+        conexao.execute("BEGIN")
+        try:
+            conexao.executemany("INSERT OR IGNORE INTO casos VALUES (?, ?, ?, ?)", casos)
+            conexao.executemany("INSERT OR REPLACE INTO sessoes VALUES (?, ?, ?, ?)", sessoes)
+            conexao.execute("COMMIT")
+            self.lotes_gravados += 1
+        except sqlite3.Error:
+            conexao.execute("ROLLBACK")
+
+    def descarregar(self):
+        """Bloqueia até que tudo o que foi agendado esteja gravado"""
+        self._fila.join()
@@ -0,0 +1,122 @@
+import os
+import secrets
+import threading
+import time
+
+# Letras sem ambiguidade para códigos ditados em voz alta
+ALFABETO_CODIGO = "ABCDEFGHJKLMNPQRSTUVWXYZ23456789"
+# Salas sem atividade por mais que isso (segundos) são descartadas
+SALA_VALIDADE = float(os.getenv("SALA_VALIDADE", str(6 * 3600)))
+
+# Estado da sala que cada participante copia quando a versão muda
+CHAVES_SALA = (
+    'pistas_descobertas', 'interrogatorios', 'resumo', 'resumo_marca',
+    'resultado_acusacao', 'acusacao_correta', 'fim_jogo'
+)
+
+
+class Sala:
+    """Um caso jogado por um grupo: pistas e interrogatórios valem para todos
+
+    Toda alteração passa pelo lock e incrementa 'versao'; os participantes só comparam a
+    versão e copiam o estado quando ela muda.
+    """
+
+    def __init__(self, codigo, caso, modo, jogadores, progresso=None, perguntas=()):
+        self.codigo = codigo
+        self.caso = caso
+        self.modo = modo
+        self.jogadores = list(jogadores)
+        self.versao = 0
+        self.atualizada_em = time.monotonic()
+        self._lock = threading.Lock()
+        self._estado = {
+            'pistas_descobertas': [],
+            'interrogatorios': {},
+            'resumo': None,
+            'resumo_marca': None,
+            'resultado_acusacao': None,
+            'acusacao_correta': None,
+            'fim_jogo': False,
+        }
+        for chave, valor in (progresso or {}).items():
+            if chave in self._estado:
+                self._estado[chave] = valor
+        self._estado['pistas_ids'] = frozenset(self._estado['pistas_descobertas'])
+        self._estado['perguntas_feitas'] = frozenset(perguntas)
+
+    def _mudou(self):
+        self.versao += 1
+        self.atualizada_em = time.monotonic()
+
+    def tocar(self):
+        """Marca atividade sem mudar a versão (um participante consultou a sala)"""
+        self.atualizada_em = time.monotonic()
+
+    def registrar_pista(self, pista_id):
+        """Devolve False se alguém do grupo já tinha encontrado a pista"""
+        with self._lock:
+            if pista_id in self._estado['pistas_ids']:
+                return False
+            self._estado['pistas_ids'] = self._estado['pistas_ids'] | {pista_id}
+            self._estado['pistas_descobertas'] = self._estado['pistas_descobertas'] + [pista_id]
+            self._mudou()
+            return True
+
+    def registrar_interrogatorio(self, personagem, chave, turno):
+        """'chave' identifica a pergunta (normalizada); devolve False se ela já foi feita"""
+        with self._lock:
+            if (personagem, chave) in self._estado['perguntas_feitas']:
+                return False
+            self._estado['perguntas_feitas'] = self._estado['perguntas_feitas'] | {(personagem, chave)}
+            interrogatorios = dict(self._estado['interrogatorios'])
+            interrogatorios[personagem] = interrogatorios.get(personagem, []) + [turno]
+            self._estado['interrogatorios'] = interrogatorios
+            self._mudou()
+            return True
+
+    def definir(self, **campos):
+        with self._lock:
+            self._estado.update((c, v) for c, v in campos.items() if c in CHAVES_SALA)
+            self._mudou()
+
+    def estado(self):
+        """(versão, estado); listas, dicts e conjuntos nunca são alterados no lugar, então podem ser compartilhados"""
+        with self._lock:
+            return self.versao, dict(self._estado)
+
+
+class SalasCompartilhadas:
+    """Salas do processo, por código"""
+
+    def __init__(self, validade=SALA_VALIDADE):
+        self.validade = validade
+        self._salas = {}
+        self._lock = threading.Lock()
+
+    def _novo_codigo(self):
+        while True:
+            codigo = "".join(secrets.choice(ALFABETO_CODIGO) for _ in range(6))
+            if codigo not in self._salas:
+                return codigo
+
+    def criar(self, caso, modo, jogadores, progresso=None, perguntas=()):
+        with self._lock:
+            self._descartar_antigas()
+            sala = Sala(self._novo_codigo(), caso, modo, jogadores, progresso, perguntas)
+            self._salas[sala.codigo] = sala
+            return sala
+
+    def obter(self, codigo):
+        with self._lock:
+            return self._salas.get((codigo or "").strip().upper())
+
+    def _descartar_antigas(self):
+        limite = time.monotonic() - self.validade
+        for codigo in [c for c, s in self._salas.items() if s.atualizada_em < limite]:
+            del self._salas[codigo]
+
+    def estatisticas(self):
+        # Só contagens: os códigos dão acesso às salas e não podem aparecer em painel nenhum
+        with self._lock:
+            return {"salas": len(self._salas), "alteracoes": sum(s.versao for s in self._salas.values())}
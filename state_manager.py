@@ -1,18 +1,64 @@
+import os
+import uuid
 import streamlit as st
+from game_logic import normalizar_pergunta, lembrar_respostas, aplicar_jogadores
+from case_library import BibliotecaCasos
+from session_store import ArmazemSessoes
+from conversation_memory import MemoriaPersonagem
+from shared_rooms import SalasCompartilhadas, CHAVES_SALA
+
+# Estado que é gravado no armazém e restaurado ao retomar uma sessão
+CHAVES_PROGRESSO = (
+    'pistas_descobertas', 'interrogatorios', 'resumo', 'resumo_marca', 'resultado_acusacao',
+    'acusacao_correta', 'fim_jogo', 'modo_jogo', 'jogadores'
+)
+
+# Respostas que cada sessão pode gerar de antemão para as perguntas sugeridas
+ANTECIPACAO_ORCAMENTO = int(os.getenv("ANTECIPACAO_ORCAMENTO", "12"))
+
+# Pacote de casos prontos, pelo nome-base sem extensão (ver case_library.py)
+BIBLIOTECA_CASOS = os.getenv("BIBLIOTECA_CASOS", "")
+
+@st.cache_resource
+def obter_armazem():
+    """Armazém de casos e sessões compartilhado pelo processo"""
+    return ArmazemSessoes()
+
+@st.cache_resource
+def obter_salas():
+    """Salas de jogo em grupo, compartilhadas por todas as sessões do processo"""
+    return SalasCompartilhadas()
+
+@st.cache_resource
+def obter_biblioteca():
+    """Biblioteca de casos mapeada em memória uma vez por processo; None sem pacote configurado"""
+    if not BIBLIOTECA_CASOS or not os.path.exists(BIBLIOTECA_CASOS + ".idx"):
+        return None
+    return BibliotecaCasos(BIBLIOTECA_CASOS)
 
 def init_session_state():
     return {
         'caso': None,
-        'pistas_descobertas': [],
+        'pistas_descobertas': [],  # ids, na ordem em que foram encontradas
+        'pistas_ids': set(),
         'interrogatorios': {},
+        'perguntas_feitas': set(),  # (personagem, pergunta normalizada)
+        'memorias': {},  # personagem -> MemoriaPersonagem
         'local_atual': None,
         'suspeito_atual': None,
-        'modo_jogo': 'normal',
+        'modo_jogo': None,  # escolhido na tela inicial
         'jogadores': [],
         'fim_jogo': False,
         'dica': None,
         'resumo': None,
-        'resultado_acusacao': None
+        'resumo_marca': None,  # o que o resumo já cobre (ver marca_resumo)
+        'resultado_acusacao': None,
+        'acusacao_correta': None,
+        'sessao_id': None,
+        'antecipacoes_restantes': ANTECIPACAO_ORCAMENTO,
+        '_antecipacao': None,  # (escopo, LoteAntecipado com as respostas antecipadas em andamento)
+        'sala': None,  # código da sala compartilhada, se a sessão estiver em uma
+        '_versao_sala': None
     }
 
 def reset_game_state():
@@ -26,4 +72,209 @@ def reset_game_state():
     
     # Inicializa o estado
     for key, value in init_session_state().items():
-        st.session_state[key] = value
\ No newline at end of file
+        st.session_state[key] = value
+
+def _deixar_sala():
+    # O que veio da sala é compartilhado e imutável (frozensets); a sessão segue sozinha
+    # com cópias que pode alterar
+    st.session_state.pistas_ids = set(st.session_state.pistas_ids)
+    st.session_state.perguntas_feitas = set(st.session_state.perguntas_feitas)
+    st.session_state.pistas_descobertas = list(st.session_state.pistas_descobertas)
+    st.session_state.interrogatorios = {
+        nome: list(turnos) for nome, turnos in st.session_state.interrogatorios.items()
+    }
+    st.session_state.sala = None
+    st.session_state._versao_sala = None
+    if "sala" in st.query_params:
+        del st.query_params["sala"]
+
+def sala_atual():
+    """Sala da sessão; se ela expirou, a sessão deixa a sala e continua o jogo sozinha"""
+    if not st.session_state.get('sala'):
+        return None
+    sala = obter_salas().obter(st.session_state.sala)
+    if sala is None:
+        _deixar_sala()
+    return sala
+
+def sincronizar_sala():
+    """Copia o estado da sala se a versão mudou desde a última cópia; devolve se copiou"""
+    sala = sala_atual()
+    if sala is None:
+        return False
+    # Uma sala com alguém olhando não expira, mesmo que ninguém mude nada
+    sala.tocar()
+    if sala.versao == st.session_state._versao_sala:
+        return False
+    versao, estado = sala.estado()
+    for chave, valor in estado.items():
+        st.session_state[chave] = valor
+    st.session_state._versao_sala = versao
+    return True
+
+def criar_sala():
+    """Transforma o jogo desta sessão numa sala; quem abrir o link joga o mesmo caso"""
+    progresso = {chave: st.session_state[chave] for chave in CHAVES_SALA}
+    progresso['pistas_descobertas'] = list(progresso['pistas_descobertas'])
+    progresso['interrogatorios'] = {nome: list(turnos) for nome, turnos in progresso['interrogatorios'].items()}
+    sala = obter_salas().criar(
+        st.session_state.caso,
+        st.session_state.modo_jogo,
+        st.session_state.jogadores,
+        progresso,
+        st.session_state.perguntas_feitas
+    )
+    st.session_state.sala = sala.codigo
+    st.query_params["sala"] = sala.codigo
+    sincronizar_sala()
+    return sala.codigo
+
+def entrar_sala():
+    """Entra na sala indicada em ?sala=... (o caso já está pronto nela); devolve se conseguiu"""
+    sala = obter_salas().obter(st.query_params.get("sala"))
+    if sala is None:
+        return False
+    st.session_state.caso = sala.caso
+    st.session_state.modo_jogo = sala.modo
+    st.session_state.jogadores = sala.jogadores
+    st.session_state.sala = sala.codigo
+    sincronizar_sala()
+    return True
+
+def definir(**campos):
+    """Altera campos do progresso na sessão e, se houver, na sala"""
+    for chave, valor in campos.items():
+        st.session_state[chave] = valor
+    sala = sala_atual()
+    if sala is not None:
+        sala.definir(**campos)
+        sincronizar_sala()
+
+def registrar_pista(pista):
+    """Marca a pista como descoberta; devolve False se ela já era conhecida"""
+    sala = sala_atual()
+    if sala is not None:
+        nova = sala.registrar_pista(pista.id)
+        sincronizar_sala()
+        return nova
+    if pista.id in st.session_state.pistas_ids:
+        return False
+    st.session_state.pistas_ids.add(pista.id)
+    st.session_state.pistas_descobertas.append(pista.id)
+    return True
+
+def registrar_interrogatorio(personagem, pergunta, resposta):
+    """Guarda a pergunta e a resposta; devolve False se a pergunta já tinha sido registrada"""
+    sala = sala_atual()
+    if sala is not None:
+        nova = sala.registrar_interrogatorio(
+            personagem, normalizar_pergunta(pergunta), {"pergunta": pergunta, "resposta": resposta}
+        )
+        sincronizar_sala()
+        return nova
+    chave = (personagem, normalizar_pergunta(pergunta))
+    if chave in st.session_state.perguntas_feitas:
+        return False
+    st.session_state.perguntas_feitas.add(chave)
+    st.session_state.interrogatorios.setdefault(personagem, []).append({
+        "pergunta": pergunta,
+        "resposta": resposta
+    })
+    return True
+
+def resposta_registrada(personagem, pergunta):
+    """Resposta já registrada para a pergunta (a mesma, normalizada), ou None"""
+    chave = normalizar_pergunta(pergunta)
+    if (personagem, chave) not in st.session_state.perguntas_feitas:
+        return None
+    for turno in reversed(st.session_state.interrogatorios.get(personagem, [])):
+        if normalizar_pergunta(turno["pergunta"]) == chave:
+            return turno["resposta"]
+    return None
+
+def memoria_de(personagem):
+    """Memória de conversa do suspeito, atualizada só com os turnos novos do histórico"""
+    memoria = st.session_state.memorias.get(personagem)
+    if memoria is None:
+        memoria = st.session_state.memorias[personagem] = MemoriaPersonagem()
+    return memoria.sincronizar(st.session_state.interrogatorios.get(personagem, []))
+
+def carregar_da_biblioteca(modo, jogadores, elenco=None):
+    """Começa um caso sorteado da biblioteca; devolve False se nenhum combinar com o filtro"""
+    biblioteca = obter_biblioteca()
+    caso = biblioteca.sortear(modo, elenco) if biblioteca is not None else None
+    if caso is None:
+        return False
+    st.session_state.modo_jogo = modo
+    st.session_state.jogadores = jogadores
+    st.session_state.caso = aplicar_jogadores(caso, jogadores)
+    st.session_state.fim_jogo = False
+    return True
+
+def novo_jogo():
+    """Volta à tela inicial, desvinculando o link da sessão e da sala anteriores"""
+    reset_game_state()
+    for parametro in ("sessao", "sala"):
+        if parametro in st.query_params:
+            del st.query_params[parametro]
+
+def _assinatura_progresso():
+    # Barata de calcular; muda sempre que algo relevante para o progresso muda
+    return (
+        st.session_state.caso.id,
+        len(st.session_state.pistas_descobertas),
+        len(st.session_state.perguntas_feitas),
+        st.session_state.resumo,
+        st.session_state.resultado_acusacao,
+        st.session_state.acusacao_correta,
+        st.session_state.fim_jogo
+    )
+
+def salvar_sessao():
+    """Agenda a gravação do caso e do progresso, se algo mudou desde a última vez"""
+    caso = st.session_state.get('caso')
+    if caso is None:
+        return
+    if not st.session_state.sessao_id:
+        st.session_state.sessao_id = uuid.uuid4().hex[:12]
+    if st.query_params.get("sessao") != st.session_state.sessao_id:
+        st.query_params["sessao"] = st.session_state.sessao_id
+
+    assinatura = _assinatura_progresso()
+    if assinatura == st.session_state.get('_assinatura_salva'):
+        return
+    armazem = obter_armazem()
+    if st.session_state.get('_caso_salvo') != caso.id:
+        armazem.salvar_caso(caso, st.session_state.modo_jogo)
+        st.session_state._caso_salvo = caso.id
+    # Cópia rasa: a serialização acontece na thread do armazém, fora da renderização
+    progresso = {chave: st.session_state[chave] for chave in CHAVES_PROGRESSO}
+    progresso['pistas_descobertas'] = list(progresso['pistas_descobertas'])
+    progresso['interrogatorios'] = {nome: list(turnos) for nome, turnos in progresso['interrogatorios'].items()}
+    armazem.salvar_progresso(st.session_state.sessao_id, caso.id, progresso)
+    st.session_state._assinatura_salva = assinatura
+
+def retomar_sessao():
+    """Restaura a sessão indicada em ?sessao=... sem gerar nada de novo; devolve se conseguiu"""
+    sessao_id = st.query_params.get("sessao")
+    if not sessao_id:
+        return False
+    salvo = obter_armazem().carregar_sessao(sessao_id)
+    if salvo is None:
+        return False
+    caso, progresso = salvo
+    st.session_state.caso = caso
+    for chave in CHAVES_PROGRESSO:
+        if chave in progresso:
+            st.session_state[chave] = progresso[chave]
+    st.session_state.pistas_ids = set(st.session_state.pistas_descobertas)
+    st.session_state.perguntas_feitas = {
+        (nome, normalizar_pergunta(turno["pergunta"]))
+        for nome, turnos in st.session_state.interrogatorios.items()
+        for turno in turnos
+    }
+    lembrar_respostas(caso, st.session_state.interrogatorios)
+    st.session_state.sessao_id = sessao_id
+    st.session_state._caso_salvo = caso.id
+    st.session_state._assinatura_salva = _assinatura_progresso()
+    return True